@@ -0,0 +1,188 @@
+"""Benchmark: CPU cost vs bytes saved of gzip, brotli and zstd per payload size.
+
+Builds payloads shaped like the API responses (a single widget, a 50 city
+widget batch, forecasts, a 15 day temperature series, a 1000 point history
+series, CSV and NDJSON exports) and times compressing each with every
+available encoding at a few levels, the configured one marked with *.
+No database or redis is needed; brotli and zstd are skipped when their
+packages are not installed.
+
+    python -m benchmarks.compression [--export-rows 100000] [--json]
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+import timeit
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from services import compression
+from services.compression import COMPRESSION_MIN_SIZE
+from services.serialization import dumps
+
+LEVELS = {
+    "gzip": (1, compression.GZIP_LEVEL, 9),
+    "br": (1, compression.BROTLI_QUALITY, 11),
+    "zstd": (1, compression.ZSTD_LEVEL, 19),
+}
+
+
+def widget(city: str) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "city": city,
+        "current_weather": {
+            category: {
+                "measurement_id": str(uuid.uuid4()),
+                "sensor_id": f"SIM-{random.randint(0, 99999):05d}-{category[:4].upper()}",
+                "station_code": f"SIM-{random.randint(0, 99999):05d}",
+                "measurement_value": round(random.uniform(0, 40), 1),
+                "category": category.capitalize(),
+                "timestamp": now.isoformat(),
+                "unit": unit,
+            }
+            for category, unit in (("temperature", "Celsius"), ("humidity", "%"), ("wind", "m/s"))
+        },
+        "user_forecast": forecast(city, date.today()),
+    }
+
+
+def forecast(city: str, day: date) -> dict:
+    return {
+        "forecast_id": str(uuid.uuid4()),
+        "forecast_date": day.isoformat(),
+        "city": city,
+        "temperature": round(random.uniform(-10, 35), 1),
+        "humidity": round(random.uniform(10, 90), 1),
+        "wind": round(random.uniform(0, 30), 1),
+    }
+
+
+def history(points: int) -> dict:
+    start = int(time.time()) - points * 3600
+    averages = [round(random.uniform(0, 30), 2) for _ in range(points)]
+    return {
+        "city": "Simulated 0",
+        "category": "Temperature",
+        "resolution": "hour",
+        "method": "bucket",
+        "start": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        "end": datetime.fromtimestamp(start + points * 3600, timezone.utc).isoformat(),
+        "series": {
+            "timestamp": [
+                datetime.fromtimestamp(start + index * 3600, timezone.utc).isoformat() for index in range(points)
+            ],
+            "min": [round(value - random.uniform(0, 3), 2) for value in averages],
+            "max": [round(value + random.uniform(0, 3), 2) for value in averages],
+            "avg": averages,
+            "count": [random.randint(50, 60) for _ in range(points)],
+        },
+    }
+
+
+def export_rows(rows: int):
+    start = datetime.now(timezone.utc) - timedelta(seconds=rows)
+    for index in range(rows):
+        yield (
+            str(uuid.uuid4()),
+            f"SIM-{index % 3000:05d}-TEMP",
+            f"SIM-{index % 3000:05d}",
+            "Simulated 0",
+            round(random.uniform(-30, 45), 1),
+            "Temperature",
+            (start + timedelta(seconds=index)).isoformat(),
+            "Celsius",
+        )
+
+
+def payloads(export_size: int) -> dict:
+    random.seed(0)
+    today = date.today()
+    rows = list(export_rows(export_size))
+    return {
+        "widget": dumps(widget("Simulated 0")),
+        "widget_batch_50": dumps([widget(f"Simulated {index}") for index in range(50)]),
+        "forecasts_7": dumps([forecast("Simulated 0", today - timedelta(days=day)) for day in range(7)]),
+        "temperature_15d": dumps({
+            "city": "Simulated 0",
+            "temperature_history": [
+                {
+                    "date": (today - timedelta(days=day)).isoformat(),
+                    "current_temperature": round(random.uniform(0, 30), 2),
+                    "predicted_temperature": round(random.uniform(0, 30), 1),
+                }
+                for day in range(15)
+            ],
+        }),
+        "history_1000": dumps(history(1000)),
+        f"export_csv_{export_size}": "\n".join(",".join(map(str, row)) for row in rows).encode(),
+        f"export_ndjson_{export_size}": b"\n".join(dumps(dict(zip(
+            ("measurement_id", "sensor_id", "station_code", "city", "measurement_value", "category",
+             "timestamp", "unit"), row))) for row in rows),
+    }
+
+
+def compressor(encoding: str, level: int):
+    if encoding == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "br":
+        return lambda data: compression.brotli.compress(data, quality=level)
+    return compression.zstandard.ZstdCompressor(level=level).compress
+
+
+def measure(data: bytes, encoding: str, level: int) -> dict:
+    compress = compressor(encoding, level)
+    compressed = compress(data)
+    # keep each measurement around 0.2 s whatever the payload size
+    number = max(1, int(0.2 / max(min(timeit.repeat(lambda: compress(data), number=1, repeat=3)), 1e-7)))
+    seconds = min(timeit.repeat(lambda: compress(data), number=number, repeat=3)) / number
+    return {
+        "level": level,
+        "bytes": len(compressed),
+        "ratio": len(data) / len(compressed),
+        "saved_bytes": len(data) - len(compressed),
+        "compress_us": seconds * 1e6,
+        "mb_per_sec": len(data) / seconds / 2 ** 20,
+        # CPU microseconds spent per KiB saved on the wire
+        "us_per_kib_saved": seconds * 1e6 / max((len(data) - len(compressed)) / 1024, 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--export-rows", type=int, default=100_000, help="rows in the export payloads")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {"min_size": COMPRESSION_MIN_SIZE, "encodings": list(compression.ENCODINGS), "payloads": {}}
+    for name, data in payloads(args.export_rows).items():
+        results["payloads"][name] = {
+            "bytes": len(data),
+            "compressed": len(data) >= COMPRESSION_MIN_SIZE,
+            "encodings": {
+                encoding: [measure(data, encoding, level) for level in sorted(set(LEVELS[encoding]))]
+                for encoding in compression.ENCODINGS
+            },
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    configured = {"gzip": compression.GZIP_LEVEL, "br": compression.BROTLI_QUALITY, "zstd": compression.ZSTD_LEVEL}
+    for name, payload in results["payloads"].items():
+        note = "" if payload["compressed"] else f"  (below COMPRESSION_MIN_SIZE={COMPRESSION_MIN_SIZE}, sent as is)"
+        print(f"{name} {payload['bytes']:,} bytes{note}")
+        for encoding, runs in payload["encodings"].items():
+            for run in runs:
+                marker = "*" if run["level"] == configured[encoding] else " "
+                print(
+                    f"  {encoding:<4} {run['level']:>2}{marker} {run['bytes']:>12,} bytes  x{run['ratio']:>6.2f}  "
+                    f"{run['compress_us']:>12,.1f} us  {run['mb_per_sec']:>8.1f} MB/s  "
+                    f"{run['us_per_kib_saved']:>7.2f} us/KiB saved"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark: random UUIDv4 vs time-ordered UUIDv7 primary keys.
+
+Generates ids in Python, then (with a database) COPYs --rows rows into two
+scratch tables shaped like weather_measurements, one per id scheme, and
+reports insert throughput plus primary key index size. The tables are
+dropped afterwards.
+
+    python -m benchmarks.ids [--rows 10000000] [--batch 100000] [--no-db] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from models.ids import uuid7
+
+SCHEMES = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+CREATE_TABLE = """
+    CREATE UNLOGGED TABLE {table} (
+        measurement_id uuid PRIMARY KEY,
+        sensor_id varchar(20) NOT NULL,
+        measurement_value numeric(10, 2) NOT NULL,
+        category varchar(50) NOT NULL,
+        timestamp timestamptz NOT NULL
+    )
+"""
+
+
+def generation_speed(number: int) -> dict:
+    return {
+        name: {"us_per_id": min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6}
+        for name, fn in SCHEMES.items()
+    }
+
+
+def records(make_id, count: int, start: datetime):
+    for index in range(count):
+        yield (
+            make_id(),
+            f"SIM-{index % 10000:05d}-TEMP",
+            round(random.uniform(-30.0, 45.0), 1),
+            "Temperature",
+            start + timedelta(milliseconds=index),
+        )
+
+
+async def insert_rows(conn, table: str, make_id, rows: int, batch: int) -> dict:
+    await conn.execute(f"DROP TABLE IF EXISTS {table}")
+    await conn.execute(CREATE_TABLE.format(table=table))
+    start = datetime.now(timezone.utc)
+    elapsed = 0.0
+    try:
+        for offset in range(0, rows, batch):
+            chunk = list(records(make_id, min(batch, rows - offset), start + timedelta(milliseconds=offset)))
+            began = time.perf_counter()
+            await conn.copy_records_to_table(table, records=chunk)
+            elapsed += time.perf_counter() - began
+
+        index_bytes = await conn.fetchval(f"SELECT pg_relation_size('{table}_pkey')")
+        table_bytes = await conn.fetchval(f"SELECT pg_relation_size('{table}')")
+    finally:
+        await conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+    return {
+        "rows": rows,
+        "insert_seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed else 0.0,
+        "pkey_index_mb": index_bytes / 2 ** 20,
+        "table_mb": table_bytes / 2 ** 20,
+    }
+
+
+async def run_database(rows: int, batch: int) -> dict:
+    import asyncpg
+
+    # asyncpg takes a plain postgres URL, not the SQLAlchemy dialect form
+    dsn = os.environ["DATABASE_URL"].replace("postgresql+asyncpg://", "postgresql://")
+    conn = await asyncpg.connect(dsn)
+    try:
+        return {
+            name: await insert_rows(conn, f"bench_ids_{name}", make_id, rows, batch)
+            for name, make_id in SCHEMES.items()
+        }
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--batch", type=int, default=100_000, help="rows per COPY")
+    parser.add_argument("--no-db", action="store_true", help="only time id generation")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {"generation": generation_speed(100_000)}
+    if not args.no_db:
+        results["insert"] = asyncio.run(run_database(args.rows, args.batch))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name, value in results["generation"].items():
+        print(f"generate {name:<6} {value['us_per_id']:>9.3f} us/id")
+    for name, value in results.get("insert", {}).items():
+        print(
+            f"insert   {name:<6} {value['rows_per_sec']:>12,.0f} rows/s  "
+            f"pkey {value['pkey_index_mb']:>9.1f} MB  table {value['table_mb']:>9.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Load test: latency and throughput of the read routes, cold and warm cache.
+
+Seeds synthetic stations, sensors, forecasts and --measurements rows into the
+Postgres at DATABASE_URL (e.g. `docker compose up -d db redis`), then drives
+the ASGI app in-process with httpx. Redis is REDIS_URL, or fakeredis with
+--fake-redis (needs `pip install fakeredis lupa`, the app runs Lua scripts).
+
+Cold requests run one at a time after dropping every cache layer (local,
+redis, station lookups); warm requests run --concurrency at a time against
+primed caches. Results are printed as JSON, tagged with the git commit, so
+runs can be diffed across commits.
+
+    python -m benchmarks.routes --stations 300 --measurements 1000000 --output bench.json
+    python -m benchmarks.routes --skip-seed --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List
+from urllib.parse import quote
+
+import httpx
+from sqlalchemy import delete, insert
+
+import database
+from database import AsyncSessionLocal, init_db
+from main import app
+from models.forecast import UserForecast
+from models.ids import uuid7
+from services.cache import _generations, compressed_cache, local_cache
+from services.ingest import INGEST_BATCH_SIZE, write_measurements
+from services.partitions import maintain_partitions
+from services.simulator import SYNTHETIC_CITY, generate_reading, percentile, synthesize_sensors
+from services.stations import invalidate_station_codes
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def city_names(stations: int, per_city: int) -> List[str]:
+    return [f"{SYNTHETIC_CITY} {index}" for index in range(-(-stations // per_city))]
+
+
+# forecasts for every city and day of the range, plus tomorrow
+async def seed_forecasts(cities: List[str], days: int):
+    today = date.today()
+    rows = [
+        {
+            "forecast_id": uuid7(),
+            "forecast_date": today - timedelta(days=offset),
+            "city": city,
+            "temperature": round(random.uniform(-10.0, 35.0), 1),
+            "humidity": round(random.uniform(10.0, 90.0), 1),
+            "wind": round(random.uniform(0.0, 30.0), 1),
+        }
+        for city in cities
+        for offset in range(-1, days)
+    ]
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(UserForecast).where(UserForecast.city.in_(cities)))
+        for start in range(0, len(rows), 5000):
+            await session.execute(insert(UserForecast).values(rows[start:start + 5000]))
+        await session.commit()
+
+
+# `count` readings spread evenly over the last `days` days, written through the
+# regular ingest path so the rollups are filled as well
+async def seed_measurements(sensors: List[dict], count: int, days: int):
+    end = datetime.now(timezone.utc)
+    rounds = max(1, count // len(sensors))
+    interval = timedelta(days=days) / rounds
+    written = 0
+    began = time.perf_counter()
+
+    rows = []
+    for step in range(rounds):
+        timestamp = end - interval * (rounds - step)
+        rows.extend(row for row in (generate_reading(sensor, timestamp) for sensor in sensors) if row)
+        if len(rows) >= INGEST_BATCH_SIZE * 10 or step == rounds - 1:
+            async with AsyncSessionLocal() as session:
+                written += await write_measurements(session, rows)
+                await session.commit()
+            rows = []
+            print(f"-- seeded {written} measurements ({written / (time.perf_counter() - began):,.0f} rows/s)")
+
+
+async def seed(args) -> dict:
+    began = time.perf_counter()
+    await maintain_partitions(since=date.today() - timedelta(days=args.days))
+    async with AsyncSessionLocal() as session:
+        sensors = await synthesize_sensors(session, args.stations, args.per_city)
+    cities = city_names(args.stations, args.per_city)
+    await seed_forecasts(cities, args.days)
+    if args.measurements:
+        await seed_measurements(sensors, args.measurements, args.days)
+    return {
+        "stations": args.stations,
+        "sensors": len(sensors),
+        "cities": len(cities),
+        "measurements": args.measurements,
+        "days": args.days,
+        "seconds": time.perf_counter() - began,
+    }
+
+
+# every cache layer a request could be served from
+async def drop_caches():
+    local_cache.clear()
+    compressed_cache.clear()
+    _generations.clear()
+    invalidate_station_codes()
+    redis_client = await database.get_redis()
+    await redis_client.flushdb()
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "requests_per_sec": len(latencies) / wall if wall else 0.0,
+    }
+
+
+async def timed(client: httpx.AsyncClient, url: str):
+    start = time.perf_counter()
+    response = await client.get(url)
+    await response.aread()
+    return time.perf_counter() - start, response.status_code < 400
+
+
+async def run_cold(client: httpx.AsyncClient, url: str, requests: int) -> dict:
+    latencies, errors, wall = [], 0, 0.0
+    for _ in range(requests):
+        await drop_caches()
+        latency, ok = await timed(client, url)
+        latencies.append(latency)
+        wall += latency
+        errors += not ok
+    return summarize(latencies, errors, wall)
+
+
+async def run_warm(client: httpx.AsyncClient, url: str, requests: int, concurrency: int) -> dict:
+    await timed(client, url)  # prime
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            latency, ok = await timed(client, url)
+            latencies.append(latency)
+            errors += not ok
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - began)
+
+
+def scenarios(cities: List[str], days: int) -> dict:
+    city = cities[0]
+    history_start = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    return {
+        "weather_widget": f"/weather/{city}",
+        "weather_batch": f"/weather?cities={','.join(cities[:50])}",
+        "forecasts": f"/forecasts/?city={city}&limit=7",
+        "temperature": f"/temperature/{city}?days=15",
+        "temperature_download": f"/temperature/{city}/download?days=15",
+        "temperature_history": f"/temperature/{city}/history?start={quote(history_start)}",
+    }
+
+
+async def run(args) -> dict:
+    if args.fake_redis:
+        if fakeredis is None:
+            raise SystemExit("--fake-redis needs `pip install fakeredis lupa`")
+        server = fakeredis.FakeServer()
+        database.redis_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        database.redis_binary_client = fakeredis.aioredis.FakeRedis(server=server)
+        database.redis_pubsub_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+
+    await init_db()
+    results = {"commit": git_commit(), "started_at": datetime.now(timezone.utc).isoformat()}
+    if not args.skip_seed:
+        results["seed"] = await seed(args)
+
+    cities = city_names(args.stations, args.per_city)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results["routes"] = {}
+        for name, url in scenarios(cities, args.days).items():
+            if args.only and name not in args.only:
+                continue
+            cold = await run_cold(client, url, args.cold_requests)
+            warm = await run_warm(client, url, args.requests, args.concurrency)
+            results["routes"][name] = {"url": url, "cold": cold, "warm": warm}
+            print(f"-- {name:<22} cold p50 {cold['p50_ms']:8.2f} ms  warm p50 {warm['p50_ms']:8.2f} ms "
+                  f"p99 {warm['p99_ms']:8.2f} ms  {warm['requests_per_sec']:9.0f} req/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--per-city", type=int, default=10, help="stations per synthetic city")
+    parser.add_argument("--measurements", type=int, default=1_000_000, help="rows to seed, 0 to skip")
+    parser.add_argument("--days", type=int, default=30, help="history span of seeded data")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse previously seeded data")
+    parser.add_argument("--requests", type=int, default=1000, help="warm requests per route")
+    parser.add_argument("--cold-requests", type=int, default=20, help="cold requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", nargs="*", help="route scenarios to run")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
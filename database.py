@@ -1,25 +1,147 @@
+import logging
 import os
-import redis.asyncio as redis
+import time
 from dotenv import load_dotenv
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, TimeoutError as RedisTimeoutError
 from models import Base
+from services.metrics import instrument_engine, registry
+from services.redis_client import CircuitBreaker, ManagedRedis
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
 # environment variables
 DATABASE_URL = os.getenv("DATABASE_URL")
 REDIS_URL = os.getenv("REDIS_URL", "redis://weather-redis:6379")
 
+# pool sizing, keep workers * (pool size + overflow) under postgres max_connections
+DB_ECHO = env_flag("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", True)
+# server-side statement timeout, 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# asyncpg prepared statement cache per connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# redis pool per client, per worker; commands fail after REDIS_SOCKET_TIMEOUT
+# instead of hanging, and connection errors are retried with backoff
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "2"))
+# consecutive connection failures before redis is skipped, and for how long
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", "5"))
+REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", "10"))
+
 if not DATABASE_URL:
     raise ValueError("Missing DATABASE_URL in environment variables!")
 
+
+class PoolMetrics:
+    """Counters for connection checkouts, fed by InstrumentedQueuePool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self, wait: float, overflow: bool):
+        self.checkouts += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        if overflow:
+            self.overflow_checkouts += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection
+    and whether it had to open one beyond pool_size."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        # starts at -pool_size and goes up by one per connection opened
+        overflow_before = self.overflow()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start, self.overflow() > max(overflow_before, 0))
+        return connection
+
+
+def pool_status() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checkouts": pool_metrics.checkouts,
+        "overflow_checkouts": pool_metrics.overflow_checkouts,
+        "timeouts": pool_metrics.timeouts,
+        "wait_seconds_total": pool_metrics.wait_seconds_total,
+        "wait_seconds_max": pool_metrics.wait_seconds_max,
+        "wait_seconds_avg": (
+            pool_metrics.wait_seconds_total / pool_metrics.checkouts if pool_metrics.checkouts else 0.0
+        ),
+    }
+
+
+server_settings = {"application_name": "weather-app-api"}
+if DB_STATEMENT_TIMEOUT_MS:
+    server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+
 # init  database connection
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "server_settings": server_settings,
+    },
+)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-# init redis
+# statement timings and pool gauges for /metrics
+instrument_engine(engine)
+registry.gauge_callback("db_pool", "Database connection pool state", pool_status)
+
+# init redis: text, binary and pub/sub clients, created at startup (or on first use
+# outside the app) and sharing one circuit breaker
 redis_client = None
+redis_binary_client = None
+redis_pubsub_client = None
+redis_breaker = CircuitBreaker(REDIS_BREAKER_FAILURES, REDIS_BREAKER_COOLDOWN)
 
 
 async def get_db():
@@ -27,13 +149,93 @@ async def get_db():
         yield session
 
 
+def create_redis_pool(**options) -> ConnectionPool:
+    return ConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), REDIS_RETRIES),
+        retry_on_error=[RedisConnectionError, RedisTimeoutError],
+        **options,
+    )
+
+
+def create_managed_redis(**options) -> ManagedRedis:
+    client = ManagedRedis(connection_pool=create_redis_pool(socket_timeout=REDIS_SOCKET_TIMEOUT, **options))
+    client.breaker = redis_breaker
+    return client
+
+
+async def init_redis():
+    global redis_client, redis_binary_client, redis_pubsub_client
+    if redis_client is None:
+        redis_client = create_managed_redis(decode_responses=True)
+    # compressed payloads are not valid UTF-8
+    if redis_binary_client is None:
+        redis_binary_client = create_managed_redis()
+    # subscriptions sit idle between messages, so no socket timeout; the
+    # health checks notice dead connections instead
+    if redis_pubsub_client is None:
+        redis_pubsub_client = Redis(connection_pool=create_redis_pool(decode_responses=True))
+
+    try:
+        await redis_client.ping()
+    except RedisError as e:
+        logger.warning("redis is unavailable, serving from the database: %s", e)
+
+
+async def close_redis():
+    global redis_client, redis_binary_client, redis_pubsub_client
+    for client in (redis_client, redis_binary_client, redis_pubsub_client):
+        if client is not None:
+            await client.aclose()
+            await client.connection_pool.disconnect()
+    redis_client = redis_binary_client = redis_pubsub_client = None
+
+
 async def get_redis():
-    global redis_client
     if redis_client is None:
-        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        await init_redis()
     return redis_client
 
+
+# same server, for binary values such as compressed payloads
+async def get_redis_binary():
+    if redis_binary_client is None:
+        await init_redis()
+    return redis_binary_client
+
+
+async def get_redis_pubsub():
+    if redis_pubsub_client is None:
+        await init_redis()
+    return redis_pubsub_client
+
+
+# send several commands in one round trip, e.g.
+# await redis_pipeline(("incr", key), ("publish", channel, message))
+async def redis_pipeline(*commands) -> list:
+    client = await get_redis()
+    async with client.pipeline(transaction=False) as pipe:
+        for name, *args in commands:
+            getattr(pipe, name)(*args)
+        return await pipe.execute()
+
+
+def redis_status() -> dict:
+    pool = redis_client.connection_pool if redis_client is not None else None
+    in_use = len(getattr(pool, "_in_use_connections", ()))
+    return {
+        **redis_breaker.stats(),
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "connections_in_use": in_use,
+        "connections_idle": len(getattr(pool, "_available_connections", ())),
+    }
+
+
+registry.gauge_callback("redis", "Redis circuit breaker and connection pool state", redis_status)
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-
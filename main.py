@@ -1,7 +1,20 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import iot_router, forecasts_router, weather_router, temperature_router
-from database import init_db
+from fastapi.responses import PlainTextResponse
+from routes import (
+    iot_router, forecasts_router, weather_router, temperature_router, export_router, system_router
+)
+from database import close_redis, init_db, init_redis
+from services.broadcast import listen_for_readings
+from services.cache import listen_for_invalidations
+from services.compression import CompressionMiddleware
+from services.ingest_queue import ingest_pipeline
+from services.metrics import MetricsMiddleware, registry
+from services.partitions import maintain_partitions, run_partition_maintenance
+from services.simulator import run_simulation
+from services.warmer import warmer
+from services.write_behind import WRITE_BEHIND_ENABLED, write_behind
 
 app = FastAPI()
 
@@ -15,16 +28,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# negotiated zstd/br/gzip for large text bodies, cached payloads arrive already compressed
+app.add_middleware(CompressionMiddleware)
+
+# per-route latency histograms
+app.add_middleware(MetricsMiddleware)
+
 # routes
 app.include_router(iot_router)
 app.include_router(forecasts_router)
 app.include_router(weather_router)
 app.include_router(temperature_router)
+app.include_router(export_router)
+app.include_router(system_router)
 
 @app.on_event("startup")
 async def startup():
     await init_db()
+    await init_redis()
+    # inserts need a partition for today before the first write
+    await maintain_partitions()
+    app.state.partition_maintenance = asyncio.create_task(run_partition_maintenance())
+    app.state.cache_listener = asyncio.create_task(listen_for_invalidations())
+    app.state.reading_listener = asyncio.create_task(listen_for_readings())
+    app.state.cache_warmer = asyncio.create_task(warmer.run())
+    if WRITE_BEHIND_ENABLED:
+        await write_behind.start()
+        ingest_pipeline.attach_sink(write_behind)
+    await ingest_pipeline.start()
+    app.state.simulator = asyncio.create_task(run_simulation(ingest_pipeline))
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.cache_listener.cancel()
+    app.state.reading_listener.cancel()
+    app.state.partition_maintenance.cancel()
+    app.state.cache_warmer.cancel()
+    # stop producing first, then let the writers drain what is queued
+    app.state.simulator.cancel()
+    await asyncio.gather(app.state.simulator, return_exceptions=True)
+    await ingest_pipeline.stop()
+    if WRITE_BEHIND_ENABLED:
+        await write_behind.stop()
+    await asyncio.gather(
+        app.state.cache_listener, app.state.reading_listener, app.state.cache_warmer, return_exceptions=True
+    )
+    await close_redis()
 
 @app.get("/")
 def read_root():
     return {"message": "FastAPI Weather Backend is Running!"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,61 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stations",
+        sa.Column("code", sa.String(20), primary_key=True),
+        sa.Column("city", sa.String(50), nullable=False),
+        sa.Column("latitude", sa.DECIMAL(9, 6), nullable=False),
+        sa.Column("longitude", sa.DECIMAL(9, 6), nullable=False),
+        sa.Column("installation_date", sa.Date(), nullable=False),
+    )
+    op.create_table(
+        "iot_sensors",
+        sa.Column("sensor_id", sa.String(20), primary_key=True),
+        sa.Column("station_code", sa.String(20), sa.ForeignKey("stations.code", ondelete="CASCADE"), nullable=False),
+        sa.Column("measurement_property", sa.String(20), nullable=False),
+    )
+    op.create_table(
+        "weather_measurements",
+        sa.Column("measurement_id", sa.UUID(), primary_key=True),
+        sa.Column("sensor_id", sa.String(20), sa.ForeignKey("iot_sensors.sensor_id", ondelete="CASCADE"), nullable=False),
+        sa.Column("measurement_value", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("category", sa.String(50), nullable=False),
+        sa.Column("timestamp", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("unit", sa.String(20), nullable=False),
+    )
+    op.create_table(
+        "user_forecasts",
+        sa.Column("forecast_id", sa.UUID(as_uuid=True), primary_key=True),
+        sa.Column("forecast_date", sa.Date(), nullable=False),
+        sa.Column("city", sa.String(100), nullable=False),
+        sa.Column("temperature", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("humidity", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("wind", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_forecasts")
+    op.drop_table("weather_measurements")
+    op.drop_table("iot_sensors")
+    op.drop_table("stations")
@@ -0,0 +1,65 @@
+"""hourly and daily measurement rollups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _rollup_columns(bucket_type):
+    return [
+        sa.Column("sensor_id", sa.String(20), sa.ForeignKey("iot_sensors.sensor_id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("category", sa.String(50), primary_key=True),
+        sa.Column("bucket", bucket_type, primary_key=True),
+        sa.Column("min_value", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("max_value", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("sum_value", sa.DECIMAL(18, 2), nullable=False),
+        sa.Column("sample_count", sa.Integer(), nullable=False),
+        sa.Column("last_value", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("last_timestamp", sa.TIMESTAMP(timezone=True), nullable=False),
+    ]
+
+
+def _backfill(table, bucket_expression):
+    op.execute(f"""
+        INSERT INTO {table}
+            (sensor_id, category, bucket, min_value, max_value, sum_value,
+             sample_count, last_value, last_timestamp)
+        SELECT
+            sensor_id,
+            category,
+            {bucket_expression} AS bucket,
+            min(measurement_value),
+            max(measurement_value),
+            sum(measurement_value),
+            count(*),
+            (array_agg(measurement_value ORDER BY timestamp DESC))[1],
+            max(timestamp)
+        FROM weather_measurements
+        GROUP BY sensor_id, category, {bucket_expression}
+    """)
+
+
+def upgrade() -> None:
+    op.create_table("measurement_rollups_hourly", *_rollup_columns(sa.TIMESTAMP(timezone=True)))
+    op.create_table("measurement_rollups_daily", *_rollup_columns(sa.Date()))
+
+    _backfill("measurement_rollups_hourly", "date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'")
+    _backfill("measurement_rollups_daily", "(timestamp AT TIME ZONE 'UTC')::date")
+
+
+def downgrade() -> None:
+    op.drop_table("measurement_rollups_daily")
+    op.drop_table("measurement_rollups_hourly")
@@ -0,0 +1,54 @@
+"""denormalized station_code and composite city lookup indexes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = {
+    "weather_measurements": ("ix_weather_measurements_station_category_ts", "timestamp"),
+    "measurement_rollups_hourly": ("ix_measurement_rollups_hourly_station_category_bucket", "bucket"),
+    "measurement_rollups_daily": ("ix_measurement_rollups_daily_station_category_bucket", "bucket"),
+}
+
+
+def upgrade() -> None:
+    for table, (index_name, time_column) in TABLES.items():
+        op.add_column(table, sa.Column("station_code", sa.String(20), nullable=True))
+
+        # backfill from the sensor each row was measured by
+        op.execute(f"""
+            UPDATE {table} AS t
+            SET station_code = s.station_code
+            FROM iot_sensors AS s
+            WHERE t.sensor_id = s.sensor_id
+        """)
+
+        op.alter_column(table, "station_code", nullable=False)
+        op.create_foreign_key(
+            f"{table}_station_code_fkey", table, "stations",
+            ["station_code"], ["code"], ondelete="CASCADE"
+        )
+        op.create_index(
+            index_name, table,
+            ["station_code", "category", sa.text(f"{time_column} DESC")]
+        )
+
+
+def downgrade() -> None:
+    for table, (index_name, _) in TABLES.items():
+        op.drop_index(index_name, table_name=table)
+        op.drop_constraint(f"{table}_station_code_fkey", table, type_="foreignkey")
+        op.drop_column(table, "station_code")
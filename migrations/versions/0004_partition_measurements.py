@@ -0,0 +1,106 @@
+"""range partition weather_measurements by timestamp
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# same settings and naming as services/partitions.py, which keeps them up to date afterwards
+INTERVAL = os.getenv("MEASUREMENT_PARTITION_INTERVAL", "day")
+PREMAKE = int(os.getenv("MEASUREMENT_PARTITION_PREMAKE", "7"))
+INDEX_NAME = "ix_weather_measurements_station_category_ts"
+
+
+def _next_start(start: date) -> date:
+    if INTERVAL == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def _create_partitions(first_day: date, last_day: date):
+    start = first_day.replace(day=1) if INTERVAL == "month" else first_day
+    while start <= last_day:
+        end = _next_start(start)
+        suffix = start.strftime("%Y%m" if INTERVAL == "month" else "%Y%m%d")
+        op.execute(
+            f"CREATE TABLE weather_measurements_p{suffix} PARTITION OF weather_measurements "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+        )
+        start = end
+
+
+def _columns():
+    return [
+        sa.Column("measurement_id", sa.UUID(), nullable=False),
+        sa.Column("sensor_id", sa.String(20), sa.ForeignKey("iot_sensors.sensor_id", ondelete="CASCADE"), nullable=False),
+        sa.Column("station_code", sa.String(20), sa.ForeignKey("stations.code", ondelete="CASCADE"), nullable=False),
+        sa.Column("measurement_value", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("category", sa.String(50), nullable=False),
+        sa.Column("timestamp", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("unit", sa.String(20), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    op.rename_table("weather_measurements", "weather_measurements_unpartitioned")
+    op.execute("ALTER INDEX weather_measurements_pkey RENAME TO weather_measurements_unpartitioned_pkey")
+    op.execute(f"ALTER INDEX {INDEX_NAME} RENAME TO {INDEX_NAME}_unpartitioned")
+
+    op.create_table(
+        "weather_measurements",
+        *_columns(),
+        sa.PrimaryKeyConstraint("measurement_id", "timestamp", name="weather_measurements_pkey"),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.create_index(INDEX_NAME, "weather_measurements", ["station_code", "category", sa.text("timestamp DESC")])
+
+    # one partition per interval from the oldest row up to PREMAKE days ahead
+    oldest = op.get_bind().execute(
+        sa.text("SELECT min(timestamp AT TIME ZONE 'UTC')::date FROM weather_measurements_unpartitioned")
+    ).scalar()
+    today = datetime.now(timezone.utc).date()
+    _create_partitions(min(oldest or today, today), today + timedelta(days=PREMAKE))
+    op.execute("CREATE TABLE weather_measurements_default PARTITION OF weather_measurements DEFAULT")
+
+    op.execute("""
+        INSERT INTO weather_measurements
+            (measurement_id, sensor_id, station_code, measurement_value, category, timestamp, unit)
+        SELECT measurement_id, sensor_id, station_code, measurement_value, category, timestamp, unit
+        FROM weather_measurements_unpartitioned
+    """)
+    op.drop_table("weather_measurements_unpartitioned")
+
+
+def downgrade() -> None:
+    op.rename_table("weather_measurements", "weather_measurements_partitioned")
+    op.execute("ALTER INDEX weather_measurements_pkey RENAME TO weather_measurements_partitioned_pkey")
+    op.execute(f"ALTER INDEX {INDEX_NAME} RENAME TO {INDEX_NAME}_partitioned")
+
+    op.create_table(
+        "weather_measurements",
+        *_columns(),
+        sa.PrimaryKeyConstraint("measurement_id", name="weather_measurements_pkey"),
+    )
+    op.create_index(INDEX_NAME, "weather_measurements", ["station_code", "category", sa.text("timestamp DESC")])
+    op.execute("""
+        INSERT INTO weather_measurements
+            (measurement_id, sensor_id, station_code, measurement_value, category, timestamp, unit)
+        SELECT measurement_id, sensor_id, station_code, measurement_value, category, timestamp, unit
+        FROM weather_measurements_partitioned
+    """)
+    # drops the partitions along with the parent
+    op.drop_table("weather_measurements_partitioned")
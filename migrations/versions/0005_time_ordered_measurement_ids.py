@@ -0,0 +1,47 @@
+"""rewrite random measurement ids as time-ordered UUIDv7
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # new rows get UUIDv7 ids from models.ids.uuid7; existing v4 ids are
+    # rewritten in place: the first 48 bits become the row's own timestamp in
+    # unix milliseconds and the version nibble becomes 7 (bits 52 and 53 of the
+    # bytea, numbered from each byte's low end), the random bits are kept.
+    # forecast ids are left alone, clients address forecasts by them.
+    op.execute("""
+        UPDATE weather_measurements
+        SET measurement_id = encode(
+            set_bit(set_bit(
+                overlay(
+                    uuid_send(measurement_id)
+                    placing substring(int8send(floor(extract(epoch FROM timestamp) * 1000)::bigint) FROM 3)
+                    FROM 1 FOR 6
+                ),
+                52, 1), 53, 1),
+            'hex')::uuid
+        WHERE get_byte(uuid_send(measurement_id), 6) >> 4 = 4
+    """)
+    # the primary key index was built in random order, rebuild it compact;
+    # REINDEX of a partitioned table can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("REINDEX TABLE weather_measurements")
+
+
+def downgrade() -> None:
+    # v7 ids are valid UUIDs, there is nothing to undo
+    pass
@@ -3,5 +3,9 @@ from .station import Station
 from .sensor import IoTSensor
 from .measurement import WeatherMeasurement
 from .forecast import UserForecast
+from .rollup import MeasurementRollupHourly, MeasurementRollupDaily
 
-__all__ = ["Base", "Station", "IoTSensor", "WeatherMeasurement", "UserForecast"]
+__all__ = [
+    "Base", "Station", "IoTSensor", "WeatherMeasurement", "UserForecast",
+    "MeasurementRollupHourly", "MeasurementRollupDaily"
+]
@@ -1,15 +1,28 @@
-import uuid
-from sqlalchemy import Column, String, DECIMAL, TIMESTAMP, ForeignKey, UUID
+from sqlalchemy import Column, String, DECIMAL, TIMESTAMP, ForeignKey, UUID, Index
 from datetime import datetime
-import uuid
 from models.base import Base
+from models.ids import uuid7
 
+# range partitioned by timestamp, partitions are managed by services.partitions
 class WeatherMeasurement(Base):
     __tablename__ = "weather_measurements"
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
-    measurement_id = Column(UUID, primary_key=True, default=lambda: str(uuid.uuid4()))
+    # the partition key has to be part of the primary key
+    measurement_id = Column(UUID, primary_key=True, default=uuid7)
     sensor_id = Column(String(20), ForeignKey("iot_sensors.sensor_id", ondelete="CASCADE"), nullable=False)
+    # denormalized from iot_sensors so city lookups are index range scans
+    station_code = Column(String(20), ForeignKey("stations.code", ondelete="CASCADE"), nullable=False)
     measurement_value = Column(DECIMAL(10,2), nullable=False)
     category = Column(String(50), nullable=False)
-    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, default=datetime.utcnow)
+    timestamp = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False, default=datetime.utcnow)
     unit = Column(String(20), nullable=False)
+
+
+# latest per category and per-day lookups for a station
+Index(
+    "ix_weather_measurements_station_category_ts",
+    WeatherMeasurement.station_code,
+    WeatherMeasurement.category,
+    WeatherMeasurement.timestamp.desc(),
+)
@@ -0,0 +1,48 @@
+from sqlalchemy import Column, String, DECIMAL, TIMESTAMP, Date, Integer, ForeignKey, Index
+from models.base import Base
+
+# hourly aggregates per sensor and category, maintained on ingest
+class MeasurementRollupHourly(Base):
+    __tablename__ = "measurement_rollups_hourly"
+
+    sensor_id = Column(String(20), ForeignKey("iot_sensors.sensor_id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String(50), primary_key=True)
+    bucket = Column(TIMESTAMP(timezone=True), primary_key=True)
+    station_code = Column(String(20), ForeignKey("stations.code", ondelete="CASCADE"), nullable=False)
+    min_value = Column(DECIMAL(10,2), nullable=False)
+    max_value = Column(DECIMAL(10,2), nullable=False)
+    sum_value = Column(DECIMAL(18,2), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    last_value = Column(DECIMAL(10,2), nullable=False)
+    last_timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+
+
+# daily aggregates per sensor and category, maintained on ingest
+class MeasurementRollupDaily(Base):
+    __tablename__ = "measurement_rollups_daily"
+
+    sensor_id = Column(String(20), ForeignKey("iot_sensors.sensor_id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String(50), primary_key=True)
+    bucket = Column(Date, primary_key=True)
+    station_code = Column(String(20), ForeignKey("stations.code", ondelete="CASCADE"), nullable=False)
+    min_value = Column(DECIMAL(10,2), nullable=False)
+    max_value = Column(DECIMAL(10,2), nullable=False)
+    sum_value = Column(DECIMAL(18,2), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    last_value = Column(DECIMAL(10,2), nullable=False)
+    last_timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+
+
+Index(
+    "ix_measurement_rollups_hourly_station_category_bucket",
+    MeasurementRollupHourly.station_code,
+    MeasurementRollupHourly.category,
+    MeasurementRollupHourly.bucket.desc(),
+)
+
+Index(
+    "ix_measurement_rollups_daily_station_category_bucket",
+    MeasurementRollupDaily.station_code,
+    MeasurementRollupDaily.category,
+    MeasurementRollupDaily.bucket.desc(),
+)
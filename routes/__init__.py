@@ -2,5 +2,10 @@ from .iot import router as iot_router
 from .forecasts import router as forecasts_router
 from .weather import router as weather_router
 from .temperature import router as temperature_router
+from .export import router as export_router
+from .system import router as system_router
 
-__all__ = ["iot_router", "forecasts_router", "weather_router", "temperature_router"]
+__all__ = [
+    "iot_router", "forecasts_router", "weather_router", "temperature_router",
+    "export_router", "system_router"
+]
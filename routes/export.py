@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from database import get_db, AsyncSessionLocal
+from models.measurement import WeatherMeasurement
+from models.station import Station
+from services.rollups import as_utc
+from services.stations import get_station_codes
+
+# parquet export is only offered when pyarrow is installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+# rows fetched per server-side cursor round trip and written per output chunk
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_COLUMNS = ["city", "station_code", "sensor_id", "category", "timestamp", "measurement_value", "unit"]
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def split_param(value: Optional[str]):
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+# stream measurement rows from postgres in chunks with a server-side cursor;
+# opens its own session because it runs after the request handler returned
+async def stream_measurement_chunks(station_codes, categories, start, end):
+    query = (
+        select(
+            Station.city,
+            WeatherMeasurement.station_code,
+            WeatherMeasurement.sensor_id,
+            WeatherMeasurement.category,
+            WeatherMeasurement.timestamp,
+            WeatherMeasurement.measurement_value,
+            WeatherMeasurement.unit,
+        )
+        .join(Station, Station.code == WeatherMeasurement.station_code)
+        .where(WeatherMeasurement.station_code.in_(station_codes))
+        .where(WeatherMeasurement.timestamp >= start)
+        .where(WeatherMeasurement.timestamp < end)
+        .order_by(
+            WeatherMeasurement.station_code,
+            WeatherMeasurement.category,
+            WeatherMeasurement.timestamp,
+        )
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    if categories:
+        query = query.where(WeatherMeasurement.category.in_(categories))
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+
+async def csv_chunks(chunks):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    yield output.getvalue().encode()
+
+    async for rows in chunks:
+        output.seek(0)
+        output.truncate(0)
+        writer.writerows(
+            (row.city, row.station_code, row.sensor_id, row.category,
+             row.timestamp.isoformat(), row.measurement_value, row.unit)
+            for row in rows
+        )
+        yield output.getvalue().encode()
+
+
+async def ndjson_chunks(chunks):
+    async for rows in chunks:
+        yield "".join(
+            json.dumps({
+                "city": row.city,
+                "station_code": row.station_code,
+                "sensor_id": row.sensor_id,
+                "category": row.category,
+                "timestamp": row.timestamp.isoformat(),
+                "measurement_value": float(row.measurement_value),
+                "unit": row.unit,
+            }) + "\n"
+            for row in rows
+        ).encode()
+
+
+class _ParquetSink(io.RawIOBase):
+    """Write-only file that hands written bytes back out between row groups."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# one parquet row group per chunk, flushed to the client as soon as it is written
+async def parquet_chunks(chunks):
+    schema = pa.schema([
+        ("city", pa.string()),
+        ("station_code", pa.string()),
+        ("sensor_id", pa.string()),
+        ("category", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("measurement_value", pa.float64()),
+        ("unit", pa.string()),
+    ])
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.table(
+                [
+                    list(columns[0]), list(columns[1]), list(columns[2]), list(columns[3]),
+                    list(columns[4]), [float(value) for value in columns[5]], list(columns[6]),
+                ],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# ASCII filename for old clients plus the RFC 6266 filename* form, city names
+# may hold quotes, separators, non-ASCII characters or line breaks
+def content_disposition(filename: str) -> str:
+    fallback = re.sub(r"[^A-Za-z0-9._-]+", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+EXPORT_WRITERS = {
+    "csv": csv_chunks,
+    "ndjson": ndjson_chunks,
+    "parquet": parquet_chunks,
+}
+
+
+# stream raw measurement history for any cities, categories and date range
+@router.get("/measurements", response_class=StreamingResponse)
+async def export_measurements(
+    cities: str = Query(..., description="Comma-separated city names"),
+    start: Optional[datetime] = Query(None, description="Inclusive start (default: 30 days ago)"),
+    end: Optional[datetime] = Query(None, description="Exclusive end (default: now)"),
+    categories: Optional[str] = Query(None, description="Comma-separated categories (default: all)"),
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    # naive bounds are taken as UTC, the column is timestamptz
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    if format == "parquet" and pa is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed")
+
+    city_names = split_param(cities)
+    station_codes = []
+    for city in city_names:
+        station_codes.extend(await get_station_codes(db, city))
+
+    if not station_codes:
+        raise HTTPException(status_code=404, detail=f"No stations found for {', '.join(city_names)}")
+
+    chunks = stream_measurement_chunks(station_codes, split_param(categories), start, end)
+    filename = f"{'_'.join(city_names)}_measurements.{format}"
+
+    return StreamingResponse(
+        EXPORT_WRITERS[format](chunks),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
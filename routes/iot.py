@@ -1,114 +1,132 @@
-import asyncio
-import random
-from datetime import datetime
-from uuid import uuid4
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from database import get_db 
+from database import get_db
 
-from models.sensor import IoTSensor 
-from models.measurement import WeatherMeasurement 
+from schemas.measurement import WeatherMeasurementSchema, BulkIngestResponseSchema, QueuedIngestResponseSchema
+from services.ingest import INGEST_BATCH_SIZE, measurement_row, write_measurements
+from services.ingest_queue import IngestQueueFull, IngestUnavailable, ingest_pipeline
+from services.latest import newest_per_station, update_latest
+from services.sensors import resolve_sensors
+from services.simulator import set_simulation_enabled
 
 router = APIRouter(prefix="/iot", tags=["IoT"])
-iot_running = False
-
-sensor_ids = [
-    {"sensor_id": "ATH-TEMP", "station_code": "ATH-001", "measurement_property": "temperature"},
-    {"sensor_id": "ATH-HUM", "station_code": "ATH-001",
-        "measurement_property": "humidity"},
-    {"sensor_id": "ATH-WIND", "station_code": "ATH-001", "measurement_property": "wind"},
-    {"sensor_id": "TIR-TEMP", "station_code": "TIR-001", "measurement_property": "temperature"},
-    {"sensor_id": "TIR-HUM", "station_code": "TIR-001",
-        "measurement_property": "humidity"},
-    {"sensor_id": "TIR-WIND", "station_code": "TIR-001", "measurement_property": "wind"},
-    {"sensor_id": "LON-TEMP", "station_code": "LON-001", "measurement_property": "temperature"},
-    {"sensor_id": "LON-HUM", "station_code": "LON-001",
-        "measurement_property": "humidity"},
-    {"sensor_id": "LON-WIND", "station_code": "LON-001", "measurement_property": "wind"}
-]
-
-#simulate iot data as it is device
-async def simulate_iot_data(db: AsyncSession):
-    global iot_running
-    while iot_running:
-        try:
-            for sensor in sensor_ids:
-                if not iot_running:
-                    return
-
-                sensor_id = sensor.get("sensor_id")
-                measurement_property_type = sensor.get("measurement_property")
-
-                if not sensor_id or not measurement_property_type:
-                    continue
-
-                result = await db.execute(select(IoTSensor).where(IoTSensor.sensor_id == sensor_id))
-                sensor_exists = result.scalar_one_or_none()
-
-                if not sensor_exists:
-                    print(f"Sensor {sensor_id} does not exist in database, skipping...")
-                    continue
-
-                #create measurement data
-                if measurement_property_type == "temperature":
-                    measurement_value = round(random.uniform(-30.0, 45.0), 1)
-                    category = "Temperature"
-                    unit = "Celsius"
-                elif measurement_property_type == "humidity":
-                    measurement_value = round(random.uniform(10.0, 90.0), 1)
-                    category = "Humidity"
-                    unit = "%"
-                elif measurement_property_type == "wind":
-                    measurement_value = round(random.uniform(1.0, 50.0), 1)
-                    category = "Wind"
-                    unit = "m/s"
-                else:
-                    continue
-
-                timestamp = datetime.utcnow()
-
-                new_measurement = WeatherMeasurement(
-                    measurement_id=uuid4(),
-                    sensor_id=sensor_id,
-                    measurement_value=measurement_value,
-                    category=category,
-                    timestamp=timestamp,
-                    unit=unit
-                )
-
-                db.add(new_measurement)
-                #new record is persisted
-                await db.flush() 
-
-            await db.commit()  
-            print(f"-- IoT Data Inserted at {datetime.utcnow()}")
-
-        except Exception as e:
-            print(f"-xx- Error in IoT Data Simulation: {e}")
-
-        await asyncio.sleep(10)  # ✅ Sleep before the next batch
+measurement_list_adapter = TypeAdapter(List[WeatherMeasurementSchema])
 
 
+# the switch lives in redis so every worker sees it, the simulation itself
+# runs in whichever worker holds the leader lease
 @router.post("/start-iot")
-async def start_iot(background_tasks: BackgroundTasks):
-    global iot_running
-    if iot_running:
+async def start_iot():
+    if not await set_simulation_enabled(True):
         raise HTTPException(status_code=400, detail="IoT simulation is already running.")
-
-    iot_running = True
-    background_tasks.add_task(start_iot_background)  
     return {"message": "IoT simulation started."}
 
-async def start_iot_background():
-    """ Starts IoT data insertion in the background """
-    async for db in get_db():
-        await simulate_iot_data(db)
-        break 
-
 
 @router.post("/stop-iot")
 async def stop_iot():
-    global iot_running
-    iot_running = False
+    await set_simulation_enabled(False)
     return {"message": "IoT simulation stopped."}
+
+
+# validate and hand measurements to the background writers, 202 once queued
+@router.post("/measurements", response_model=QueuedIngestResponseSchema, status_code=202)
+async def enqueue_measurements(measurements: List[WeatherMeasurementSchema], db: AsyncSession = Depends(get_db)):
+    sensors = await resolve_sensors(db, {m.sensor_id for m in measurements})
+    rows = []
+    unknown_sensors = set()
+    for measurement in measurements:
+        if measurement.sensor_id in sensors:
+            rows.append(measurement_row(measurement, sensors[measurement.sensor_id]["station_code"]))
+        else:
+            unknown_sensors.add(measurement.sensor_id)
+
+    if len(rows) > ingest_pipeline.max_rows:
+        raise HTTPException(status_code=413, detail="Batch exceeds the ingest queue capacity, split it up.")
+    try:
+        ingest_pipeline.offer(rows)
+    except IngestQueueFull:
+        raise HTTPException(status_code=429, detail="Ingest queue is full, retry later.", headers={"Retry-After": "1"})
+    except IngestUnavailable:
+        raise HTTPException(status_code=503, detail="Ingest is not accepting measurements.", headers={"Retry-After": "5"})
+
+    return QueuedIngestResponseSchema(
+        accepted=len(rows),
+        rejected=len(measurements) - len(rows),
+        unknown_sensors=sorted(unknown_sensors)
+    )
+
+
+# validate sensors against the cached registry and write one batch inside the
+# request's transaction, the caller commits once the whole body is written;
+# ids that are already stored are skipped, so a retried body writes nothing twice
+async def ingest_batch(db: AsyncSession, measurements: List[WeatherMeasurementSchema], summary: dict):
+    sensors = await resolve_sensors(db, {m.sensor_id for m in measurements})
+    rows = []
+    for measurement in measurements:
+        if measurement.sensor_id in sensors:
+            rows.append(measurement_row(measurement, sensors[measurement.sensor_id]["station_code"]))
+        else:
+            summary["rejected"] += 1
+            summary["unknown_sensors"].add(measurement.sensor_id)
+
+    if rows:
+        summary["inserted"] += await write_measurements(db, rows, skip_existing=True)
+        # only the newest reading per station and category reaches the live state
+        newest = newest_per_station(summary["latest"] + rows)
+        summary["latest"] = [row for categories in newest.values() for row in categories.values()]
+
+
+# yield (line number, line) from a streamed request body
+async def iter_ndjson_lines(request: Request):
+    buffer = b""
+    line_number = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+
+# bulk ingest measurements sent as a JSON array or an NDJSON stream; the
+# whole body is validated before anything is written and then stored in one
+# transaction, so a rejected body stores nothing, a slow upload holds no row
+# locks, and a body can be retried as a whole
+@router.post("/measurements/bulk", response_model=BulkIngestResponseSchema)
+async def bulk_ingest_measurements(request: Request, db: AsyncSession = Depends(get_db)):
+    summary = {"inserted": 0, "rejected": 0, "unknown_sensors": set(), "latest": []}
+    content_type = request.headers.get("content-type", "")
+
+    if "ndjson" in content_type:
+        measurements = []
+        async for line_number, line in iter_ndjson_lines(request):
+            try:
+                measurements.append(WeatherMeasurementSchema.model_validate_json(line))
+            except ValidationError as e:
+                raise RequestValidationError(
+                    [{**error, "loc": ("body", line_number, *error["loc"])} for error in e.errors()]
+                )
+    else:
+        try:
+            measurements = measurement_list_adapter.validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors()]
+            )
+
+    for start in range(0, len(measurements), INGEST_BATCH_SIZE):
+        await ingest_batch(db, measurements[start:start + INGEST_BATCH_SIZE], summary)
+
+    await db.commit()
+    await update_latest(summary["latest"])
+    return BulkIngestResponseSchema(
+        inserted=summary["inserted"],
+        rejected=summary["rejected"],
+        unknown_sensors=sorted(summary["unknown_sensors"])
+    )
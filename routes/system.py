@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+from database import pool_status, redis_status
+from services.broadcast import hub
+from services.cache import local_cache
+from services.ingest_queue import ingest_pipeline
+from services.warmer import warmer
+from services.write_behind import write_behind
+
+router = APIRouter(prefix="/system", tags=["System"])
+
+
+# in-process cache counters for sizing LOCAL_CACHE_MAX_ENTRIES / LOCAL_CACHE_TTL
+@router.get("/cache")
+async def get_cache_stats():
+    return local_cache.stats()
+
+
+# connection pool usage and checkout wait times for tuning DB_POOL_SIZE / DB_MAX_OVERFLOW
+@router.get("/db-pool")
+async def get_db_pool_stats():
+    return pool_status()
+
+
+# redis circuit breaker state and connection usage for tuning REDIS_MAX_CONNECTIONS
+@router.get("/redis")
+async def get_redis_stats():
+    return redis_status()
+
+
+# background ingest queue depth, rejections and write rate, plus the write-behind buffer
+@router.get("/ingest")
+async def get_ingest_stats():
+    return {**ingest_pipeline.status(), "write_behind": write_behind.status()}
+
+
+# live stream clients per worker and how many were dropped for falling behind
+@router.get("/streams")
+async def get_stream_stats():
+    return hub.stats()
+
+
+# popular keys tracked by the cache warmer and how many refreshes it ran
+@router.get("/warmer")
+async def get_warmer_stats():
+    return warmer.stats()
@@ -1,80 +1,55 @@
-import json
 import csv
 import io
-from fastapi import APIRouter, Depends, Query, Response
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import Float, cast, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.sql import func
-from datetime import date, timedelta, datetime
-from database import get_db, get_redis
+from datetime import date, timedelta, datetime, timezone
+import numpy as np
+from database import get_db
+from services.serialization import dumps
+from services.cache import get_or_compute, cached_response
+from services.warmer import warmer, with_session
+from services.downsample import RESOLUTION_SECONDS, BucketAccumulator, lttb, rebucket
 from models.measurement import WeatherMeasurement
+from models.rollup import MeasurementRollupDaily, MeasurementRollupHourly
 from models.forecast import UserForecast
-from schemas.temperature import TemperatureVisualizationSchema
-import redis.asyncio as redis
-from uuid import UUID
-from decimal import Decimal
+from services.stations import get_station_codes
+from schemas.temperature import TemperatureVisualizationSchema, TemperatureHistorySchema
 
 router = APIRouter(prefix="/temperature", tags=["Temperature Visualization"])
 
+# minute resolution reads raw measurements, keep its range bounded
+HISTORY_MAX_RAW_DAYS = int(os.getenv("HISTORY_MAX_RAW_DAYS", "31"))
+HISTORY_CHUNK_SIZE = int(os.getenv("HISTORY_CHUNK_SIZE", "50000"))
+HISTORY_CACHE_TTL = 60
 
-# JSON serialization
-def custom_json_serializer(obj):
-    if isinstance(obj, UUID):
-        return str(obj)
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    return None
-
-
-# get actual  and predicted temperature data
-@router.get("/{city}", response_model=TemperatureVisualizationSchema)
-async def get_city_temperature(
-    city: str,
-    days: int = Query(5, ge=1, le=15), 
-    db: AsyncSession = Depends(get_db),
-):
-    redis_client = await get_redis()
-    cache_key = f"temperature:{city.lower()}:{days}"
-
-    cached_data = await redis_client.get(cache_key)
-    if cached_data:
-        return json.loads(cached_data)
-
-    start_date = date.today() - timedelta(days=days)
-
-    # latest actual IoT temperature per day
-    iot_subquery = (
-        select(
-            func.date(WeatherMeasurement.timestamp).label("date"),
-            func.max(WeatherMeasurement.timestamp).label("latest_timestamp") 
-        )
-        .where(WeatherMeasurement.sensor_id.ilike(f"{city[:3].upper()}-%"))
-        .where(WeatherMeasurement.category == "Temperature")
-        .where(WeatherMeasurement.timestamp >= start_date)
-        .group_by(func.date(WeatherMeasurement.timestamp))
-        .subquery()
-    )
 
+# latest actual IoT temperature per day, read from the daily rollups
+async def fetch_daily_temperatures(db: AsyncSession, city: str, start_date: date):
+    station_codes = await get_station_codes(db, city)
     iot_result = await db.execute(
         select(
-            WeatherMeasurement.timestamp,
-            WeatherMeasurement.measurement_value.label("actual_temperature")
+            MeasurementRollupDaily.bucket.label("date"),
+            MeasurementRollupDaily.last_value.label("actual_temperature")
         )
-        .join(
-            iot_subquery,
-            WeatherMeasurement.timestamp == iot_subquery.c.latest_timestamp
-        )
-        .order_by(WeatherMeasurement.timestamp.desc())  
+        .where(MeasurementRollupDaily.station_code.in_(station_codes))
+        .where(MeasurementRollupDaily.category == "Temperature")
+        .where(MeasurementRollupDaily.bucket >= start_date)
+        .distinct(MeasurementRollupDaily.bucket)
+        .order_by(MeasurementRollupDaily.bucket.desc(), MeasurementRollupDaily.last_timestamp.desc())
     )
 
-    iot_temperatures = {
-        row.timestamp.date(): row.actual_temperature
-        for row in iot_result if row.timestamp
+    return {
+        row.date: row.actual_temperature
+        for row in iot_result if row.date
     }
 
-    # get user-predicted temperature
+
+# user-predicted temperature per day
+async def fetch_forecast_temperatures(db: AsyncSession, city: str, start_date: date):
     forecast_result = await db.execute(
         select(
             UserForecast.forecast_date,
@@ -85,11 +60,19 @@ async def get_city_temperature(
         .order_by(UserForecast.forecast_date.desc())
     )
 
-    forecast_temperatures = {
+    return {
         row.forecast_date: row.predicted_temperature
         for row in forecast_result if row.forecast_date
     }
 
+
+# serialized actual and predicted temperature data
+async def build_temperature_payload(db: AsyncSession, city: str, days: int) -> bytes:
+    start_date = date.today() - timedelta(days=days)
+
+    iot_temperatures = await fetch_daily_temperatures(db, city, start_date)
+    forecast_temperatures = await fetch_forecast_temperatures(db, city, start_date)
+
     # IoT and forecast data
     temperature_data = []
     for day_offset in range(days):
@@ -111,14 +94,158 @@ async def get_city_temperature(
         "temperature_history": temperature_data
     }
 
-    # redis store
-    await redis_client.setex(
+    return dumps(response_data)
+
+
+# get actual  and predicted temperature data
+@router.get("/{city}", response_model=TemperatureVisualizationSchema)
+async def get_city_temperature(
+    city: str,
+    request: Request,
+    days: int = Query(5, ge=1, le=15), 
+    db: AsyncSession = Depends(get_db),
+):
+    cache_key = f"temperature:{city.lower()}:{days}"
+
+    # local cache, then redis, stored 10min on miss
+    payload = await get_or_compute(
         cache_key,
         timedelta(minutes=10).seconds,
-        json.dumps(response_data, default=custom_json_serializer)
+        lambda: build_temperature_payload(db, city, days)
     )
+    warmer.record(cache_key, timedelta(minutes=10).seconds, with_session(build_temperature_payload, city, days))
+
+    ttl = timedelta(minutes=10).seconds
+    return await cached_response(payload, request, max_age=ttl, variant_ttl=ttl)
+
 
-    return response_data
+def as_epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+# coarsest needed resolution: the finest one whose bucket count fits in max_points
+def pick_resolution(start: int, end: int, max_points: int) -> str:
+    for resolution, step in RESOLUTION_SECONDS.items():
+        if (end - start) / step <= max_points:
+            return resolution
+    return "day"
+
+
+# per-resolution source: raw (epoch, value) rows for minutes, pre-aggregated
+# (epoch, min, max, sum, count) rows from the rollups for hours and days
+def history_query(resolution: str, station_codes: List[str], category: str, start: int, end: int):
+    start_at = datetime.fromtimestamp(start, timezone.utc)
+    end_at = datetime.fromtimestamp(end, timezone.utc)
+    if resolution == "minute":
+        return (
+            select(
+                cast(func.extract("epoch", WeatherMeasurement.timestamp), Float),
+                cast(WeatherMeasurement.measurement_value, Float),
+            )
+            .where(WeatherMeasurement.station_code.in_(station_codes))
+            .where(WeatherMeasurement.category == category)
+            .where(WeatherMeasurement.timestamp >= start_at)
+            .where(WeatherMeasurement.timestamp < end_at)
+        )
+
+    rollup = MeasurementRollupHourly if resolution == "hour" else MeasurementRollupDaily
+    bounds = (start_at, end_at) if resolution == "hour" else (start_at.date(), end_at.date())
+    return (
+        select(
+            cast(func.extract("epoch", rollup.bucket), Float),
+            cast(rollup.min_value, Float),
+            cast(rollup.max_value, Float),
+            cast(rollup.sum_value, Float),
+            rollup.sample_count,
+        )
+        .where(rollup.station_code.in_(station_codes))
+        .where(rollup.category == category)
+        .where(rollup.bucket >= bounds[0])
+        .where(rollup.bucket < bounds[1])
+    )
+
+
+# serialized downsampled series, rows are streamed into a fixed bucket grid
+async def build_history_payload(
+    db: AsyncSession, city: str, category: str, start: int, end: int,
+    resolution: str, max_points: int, method: str
+) -> bytes:
+    station_codes = await get_station_codes(db, city)
+    accumulator = BucketAccumulator(start, end, RESOLUTION_SECONDS[resolution])
+    if station_codes:
+        query = history_query(resolution, station_codes, category, start, end)
+        result = await db.stream(query.execution_options(yield_per=HISTORY_CHUNK_SIZE))
+        async for rows in result.partitions():
+            columns = np.array(rows, dtype=np.float64).T
+            if resolution == "minute":
+                accumulator.add_values(*columns)
+            else:
+                accumulator.add(*columns)
+
+    series = accumulator.series()
+    if method == "lttb":
+        series = lttb(series, max_points)
+    else:
+        series = rebucket(series, start, end, max_points)
+
+    return dumps({
+        "city": city,
+        "category": category,
+        "resolution": resolution,
+        "method": method,
+        "start": datetime.fromtimestamp(start, timezone.utc),
+        "end": datetime.fromtimestamp(end, timezone.utc),
+        "series": {
+            "timestamp": [datetime.fromtimestamp(t, timezone.utc) for t in series["timestamp"].tolist()],
+            "min": np.round(series["min"], 2).tolist(),
+            "max": np.round(series["max"], 2).tolist(),
+            "avg": np.round(series["avg"], 2).tolist(),
+            "count": series["count"].tolist(),
+        },
+    })
+
+
+# downsampled min/max/avg series of any category over an arbitrary range
+@router.get("/{city}/history", response_model=TemperatureHistorySchema)
+async def get_city_history(
+    city: str,
+    request: Request,
+    start: Optional[datetime] = Query(None, description="Inclusive start (default: 7 days before end)"),
+    end: Optional[datetime] = Query(None, description="Exclusive end (default: now)"),
+    category: str = Query("Temperature", pattern="^(Temperature|Humidity|Wind)$"),
+    resolution: Optional[str] = Query(None, pattern="^(minute|hour|day)$",
+                                      description="Bucket size (default: finest that fits max_points)"),
+    max_points: int = Query(1000, ge=10, le=5000),
+    method: str = Query("bucket", pattern="^(bucket|lttb)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    end_epoch = as_epoch(end or datetime.now(timezone.utc))
+    start_epoch = as_epoch(start) if start else end_epoch - 7 * 86400
+    if start_epoch >= end_epoch:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    resolution = resolution or pick_resolution(start_epoch, end_epoch, max_points)
+    if resolution == "minute" and end_epoch - start_epoch > HISTORY_MAX_RAW_DAYS * 86400:
+        raise HTTPException(
+            status_code=400, detail=f"minute resolution is limited to {HISTORY_MAX_RAW_DAYS} days")
+
+    # align the grid to bucket boundaries, which also lets "now" requests share a cache entry
+    step = RESOLUTION_SECONDS[resolution]
+    start_epoch -= start_epoch % step
+    end_epoch += -end_epoch % step
+
+    cache_key = (
+        f"temperature:{city.lower()}:history:{category}:{resolution}:{method}:{max_points}:{start_epoch}:{end_epoch}"
+    )
+    payload = await get_or_compute(
+        cache_key,
+        HISTORY_CACHE_TTL,
+        lambda: build_history_payload(db, city, category, start_epoch, end_epoch, resolution, max_points, method)
+    )
+
+    return await cached_response(payload, request, max_age=HISTORY_CACHE_TTL, variant_ttl=HISTORY_CACHE_TTL)
 
 
 # donwload csv temperatures
@@ -130,39 +257,8 @@ async def download_city_temperature_csv(
 ):
     start_date = date.today() - timedelta(days=days)
 
-    # get raw IoT temperature per day
-    iot_result = await db.execute(
-        select(
-            func.date(WeatherMeasurement.timestamp).label("date"),
-            WeatherMeasurement.measurement_value.label("actual_temperature")  
-        )
-        .where(WeatherMeasurement.sensor_id.ilike(f"{city[:3].upper()}-%"))
-        .where(WeatherMeasurement.category == "Temperature")
-        .where(WeatherMeasurement.timestamp >= start_date)
-        .group_by(func.date(WeatherMeasurement.timestamp), WeatherMeasurement.measurement_value)
-        .order_by(func.date(WeatherMeasurement.timestamp).desc())
-    )
-
-    iot_temperatures = {
-        row.date: row.actual_temperature
-        for row in iot_result if row.date
-    }
-
-    # get user-predicted temperature
-    forecast_result = await db.execute(
-        select(
-            UserForecast.forecast_date,
-            UserForecast.temperature.label("predicted_temperature") 
-        )
-        .where(UserForecast.city == city)
-        .where(UserForecast.forecast_date >= start_date)
-        .order_by(UserForecast.forecast_date.desc())
-    )
-
-    forecast_temperatures = {
-        row.forecast_date: row.predicted_temperature
-        for row in forecast_result if row.forecast_date
-    }
+    iot_temperatures = await fetch_daily_temperatures(db, city, start_date)
+    forecast_temperatures = await fetch_forecast_temperatures(db, city, start_date)
 
     # merge data into csv formatt
     csv_data = [["Date", "Current Temperature", "Predicted Temperature"]]
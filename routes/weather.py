@@ -1,133 +1,272 @@
-import json
-from fastapi import APIRouter, Depends
+import logging
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, column, true, values
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.sql import func, and_
 from sqlalchemy.orm import aliased
-from datetime import date, timedelta, datetime
-from database import get_db, get_redis
+from datetime import date, timedelta
+from redis.exceptions import RedisError
+from database import get_db, redis_pipeline, AsyncSessionLocal
+from services.serialization import dumps
+from services.broadcast import hub, next_event
+from services.cache import cached_response, etag, get_or_compute, get_or_compute_many
+from services.ingest import measurement_row
+from services.latest import (
+    CATEGORIES, get_station_latest, latest_key, merge_latest, states_from_rows, update_latest
+)
 from models.measurement import WeatherMeasurement
 from models.forecast import UserForecast
-from schemas.weather import WeatherWidgetResponseSchema, CurrentWeatherSchema
-from schemas.measurement import IoTMeasurementSchema
+from services.stations import get_station_codes, get_station_codes_many
+from services.warmer import warmer, with_session
+from schemas.weather import WeatherWidgetResponseSchema, WeatherBatchRequestSchema
 from schemas.forecast import UserForecastResponseSchema
-from typing import Dict, Optional
-from uuid import UUID
-from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 
 router = APIRouter(prefix="/weather", tags=["Weather Widget"])
+logger = logging.getLogger(__name__)
 
-# serialize JSON objects
-def custom_json_serializer(obj):
-    if isinstance(obj, UUID):
-        return str(obj)
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    if isinstance(obj, date):
-        return obj.isoformat()
-    raise TypeError(
-        f"Object of type {obj.__class__.__name__} is not JSON serializable")
-
-
-# IoT data + user forecast with Redis caching
+# comment sent on idle streams so proxies keep them open
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+# upper bound on cities per batch request
+WEATHER_BATCH_MAX_CITIES = int(os.getenv("WEATHER_BATCH_MAX_CITIES", "200"))
+FORECAST_CACHE_TTL = timedelta(minutes=10).seconds
+# widgets embed live readings, so clients may only reuse them briefly
+WIDGET_MAX_AGE = int(os.getenv("WIDGET_MAX_AGE", "10"))
+
+
+# latest measurement per (station, category), used to seed the live state; one
+# LATERAL ... ORDER BY timestamp DESC LIMIT 1 per pair walks the
+# (station_code, category, timestamp DESC) index from the newest partition
+# down, so a station that went quiet long ago still shows its last reading
+async def fetch_latest_measurements(db: AsyncSession, station_codes: List[str]) -> List[WeatherMeasurement]:
+    if not station_codes:
+        return []
+
+    pairs = values(column("station_code", String), column("category", String), name="pairs").data(
+        [(station_code, category.capitalize()) for station_code in station_codes for category in CATEGORIES]
+    )
+    latest = (
+        select(WeatherMeasurement)
+        .where(WeatherMeasurement.station_code == pairs.c.station_code)
+        .where(WeatherMeasurement.category == pairs.c.category)
+        .order_by(WeatherMeasurement.timestamp.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+    result = await db.execute(
+        select(aliased(WeatherMeasurement, latest)).select_from(pairs).join(latest, true())
+    )
+    return list(result.scalars().all())
+
+
+def forecast_json(forecast: Optional[UserForecast]) -> bytes:
+    if forecast is None:
+        return b"null"
+
+    return dumps(UserForecastResponseSchema(
+        forecast_id=forecast.forecast_id,
+        forecast_date=forecast.forecast_date,
+        city=forecast.city,
+        temperature=forecast.temperature,
+        humidity=forecast.humidity,
+        wind=forecast.wind,
+    ).model_dump())
+
+
+# serialized forecast for tomorrow, the only cached part of the widget
+async def build_forecast_payload(db: AsyncSession, city: str) -> bytes:
+    tomorrow = date.today() + timedelta(days=1)
+    result = await db.execute(
+        select(UserForecast)
+        .where(UserForecast.city == city)
+        .where(UserForecast.forecast_date == tomorrow)
+        .limit(1)
+    )
+    return forecast_json(result.scalars().first())
+
+
+# tomorrow's forecast for many cities in one query, keyed by lowercased city
+async def build_forecast_payloads(db: AsyncSession, cities: List[str]) -> Dict[str, bytes]:
+    tomorrow = date.today() + timedelta(days=1)
+    result = await db.execute(
+        select(UserForecast)
+        .where(UserForecast.city.in_(cities))
+        .where(UserForecast.forecast_date == tomorrow)
+        .distinct(UserForecast.city)
+        .order_by(UserForecast.city)
+    )
+    forecasts = {forecast.city.lower(): forecast for forecast in result.scalars()}
+    return {city.lower(): forecast_json(forecasts.get(city.lower())) for city in cities}
+
+
+# stations with no live state yet (e.g. redis was flushed) are seeded from
+# postgres once; stations without any measurement are marked so they aren't re-queried
+async def seed_latest(db: AsyncSession, station_codes: List[str]):
+    measurements = await fetch_latest_measurements(db, station_codes)
+    await update_latest([measurement_row(m, m.station_code) for m in measurements], publish=False)
+    await redis_pipeline(*(("hset", latest_key(station_code), "seeded", 1) for station_code in station_codes))
+
+
+# live state of the stations, seeded where missing; read from postgres
+# altogether while redis is unavailable
+async def load_station_states(db: AsyncSession, station_codes: List[str]) -> Dict[str, Dict[str, Tuple[str, float]]]:
+    try:
+        states, missing = await get_station_latest(station_codes)
+        if missing:
+            await seed_latest(db, missing)
+            states, _ = await get_station_latest(station_codes)
+        return states
+    except RedisError as e:
+        logger.debug("live state unavailable, reading latest measurements from the database: %s", e)
+        measurements = await fetch_latest_measurements(db, station_codes)
+        return states_from_rows(measurement_row(m, m.station_code) for m in measurements)
+
+
+# current conditions of a city from the live state, already serialized
+async def current_weather_payload(db: AsyncSession, station_codes: List[str]) -> bytes:
+    states = await load_station_states(db, station_codes)
+    return current_weather_json(merge_latest(states, station_codes))
+
+
+def current_weather_json(latest: Dict[str, Tuple[str, float]]) -> bytes:
+    if not latest:
+        return b"null"
+    fields = [
+        dumps(category) + b":" + (latest[category][0].encode() if category in latest else b"null")
+        for category in CATEGORIES
+    ]
+    return b"{" + b",".join(fields) + b"}"
+
+
+# IoT data from the live state + user forecast cached in redis
 @router.get("/{city}", response_model=WeatherWidgetResponseSchema)
 async def get_weather_widget(
     city: str,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
-    redis_client = await get_redis()
-    cache_key = f"weather:{city.lower()}"
-    user_forecast_alias = aliased(UserForecast)
+    station_codes = await get_station_codes(db, city)
+    current_weather = await current_weather_payload(db, station_codes)
 
-    # check Redis cache first
-    cached_data = await redis_client.get(cache_key)
-    if cached_data:
-        return json.loads(cached_data)
+    # local cache, then Redis, stored 10min on miss
+    forecast = await get_or_compute(
+        forecast_cache_key(city), FORECAST_CACHE_TTL, lambda: build_forecast_payload(db, city))
+    warmer.record(forecast_cache_key(city), FORECAST_CACHE_TTL, with_session(build_forecast_payload, city))
 
+    return await cached_response(widget_json(city, current_weather, forecast), request, max_age=WIDGET_MAX_AGE)
 
-    # fetch latest IoT weather data
-    subquery = (
-        select(
-            WeatherMeasurement.category,
-            func.max(WeatherMeasurement.timestamp).label("latest_timestamp"),
-        )
-        .where(WeatherMeasurement.sensor_id.ilike(f"{city[:3].upper()}-%"))
-        .group_by(WeatherMeasurement.category)
-        .subquery()
-    )
 
-    result = await db.execute(
-        select(WeatherMeasurement)
-        .join(
-            subquery,
-            and_(
-                WeatherMeasurement.category == subquery.c.category,
-                WeatherMeasurement.timestamp == subquery.c.latest_timestamp,
-            ),
-        )
-        .join(
-            user_forecast_alias,
-            user_forecast_alias.city == city
-        )
-        .where(WeatherMeasurement.sensor_id.ilike(f"{city[:3].upper()}-%"))
+def forecast_cache_key(city: str) -> str:
+    return f"weather:{city.lower()}:forecast"
+
+
+# splice the pre-serialized parts instead of re-encoding them
+def widget_json(city: str, current_weather: bytes, forecast: bytes) -> bytes:
+    return (
+        b'{"city":' + dumps(city)
+        + b',"current_weather":' + current_weather
+        + b',"user_forecast":' + forecast + b"}"
     )
 
-    latest_weather_data = result.scalars().all()
-    weather_data_dict: Dict[str, Optional[IoTMeasurementSchema]] = {}
-
-    for measurement in latest_weather_data:
-        category = measurement.category.lower()
-        weather_data_dict[category] = IoTMeasurementSchema(
-            measurement_id=measurement.measurement_id,
-            sensor_id=measurement.sensor_id,
-            date=measurement.timestamp,
-            station=measurement.sensor_id.split("-")[0],
-            info={
-                "category": measurement.category,
-                "measurement": measurement.measurement_value,
-                "unit": measurement.unit
-            }
+
+# widgets for many cities: one station lookup, one pipelined live-state read,
+# one seed query for stations without live state, one MGET for the forecasts
+# and one query plus one pipelined cache fill for the forecast misses
+async def build_widgets(db: AsyncSession, cities: List[str]) -> bytes:
+    # first spelling of each city wins, order is kept
+    first_spelling: Dict[str, str] = {}
+    for city in cities:
+        first_spelling.setdefault(city.lower(), city)
+    unique_cities = list(first_spelling.values())
+    if len(unique_cities) > WEATHER_BATCH_MAX_CITIES:
+        raise HTTPException(status_code=400, detail=f"At most {WEATHER_BATCH_MAX_CITIES} cities per request")
+
+    codes_by_city = await get_station_codes_many(db, unique_cities)
+    station_codes = sorted({code for codes in codes_by_city.values() for code in codes})
+    states = await load_station_states(db, station_codes)
+
+    cities_by_key = {forecast_cache_key(city): city for city in unique_cities}
+
+    async def load_forecasts(keys: List[str]) -> Dict[str, bytes]:
+        payloads = await build_forecast_payloads(db, [cities_by_key[key] for key in keys])
+        return {key: payloads[cities_by_key[key].lower()] for key in keys}
+
+    forecasts = await get_or_compute_many(list(cities_by_key), FORECAST_CACHE_TTL, load_forecasts)
+    for key, city in cities_by_key.items():
+        warmer.record(key, FORECAST_CACHE_TTL, with_session(build_forecast_payload, city))
+
+    widgets = [
+        widget_json(
+            city,
+            current_weather_json(merge_latest(states, codes_by_city[city.lower()])),
+            forecasts[forecast_cache_key(city)],
         )
+        for city in unique_cities
+    ]
+    return b"[" + b",".join(widgets) + b"]"
 
-    #convert IoT data into correct response format
-    current_weather = CurrentWeatherSchema(
-        temperature=weather_data_dict.get("temperature"),
-        humidity=weather_data_dict.get("humidity"),
-        wind=weather_data_dict.get("wind")
-    )
 
-    # fetch latest user forecast for today
-    today = date.today()
-    tomorrow = today + timedelta(days=1)
+# widgets for a comma-separated list of cities
+@router.get("", response_model=List[WeatherWidgetResponseSchema])
+async def get_weather_widgets(
+    request: Request,
+    cities: str = Query(..., description="Comma-separated city names"),
+    db: AsyncSession = Depends(get_db)
+):
+    city_names = [city.strip() for city in cities.split(",") if city.strip()]
+    if not city_names:
+        raise HTTPException(status_code=400, detail="cities must not be empty")
+    return await cached_response(await build_widgets(db, city_names), request, max_age=WIDGET_MAX_AGE)
+
 
-    forecast_result = await db.execute(
-        select(UserForecast)
-        .where(UserForecast.city == city)
-        .where(UserForecast.forecast_date == tomorrow)
+# same as GET /weather for lists too long for a query string; a POST response
+# is neither revalidated with If-None-Match (that would be a 412, not a 304,
+# RFC 9110 13.1.2) nor reusable by shared caches, so the ETag is informational
+@router.post("", response_model=List[WeatherWidgetResponseSchema])
+async def post_weather_widgets(
+    body: WeatherBatchRequestSchema,
+    db: AsyncSession = Depends(get_db)
+):
+    payload = await build_widgets(db, body.cities)
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag(payload)})
+
+
+# server-sent events: current conditions first, then every new reading of the city's stations
+@router.get("/{city}/stream", response_class=StreamingResponse)
+async def stream_weather(city: str, request: Request):
+    # own short session, a pooled connection must not stay checked out for the stream
+    async with AsyncSessionLocal() as db:
+        station_codes = await get_station_codes(db, city)
+        if not station_codes:
+            raise HTTPException(status_code=404, detail=f"No stations found for {city}")
+
+        # subscribe before reading the snapshot so no reading falls in between
+        subscriber = hub.subscribe(station_codes)
+        try:
+            current_weather = await current_weather_payload(db, station_codes)
+        except Exception:
+            hub.unsubscribe(subscriber)
+            raise
+
+    async def events():
+        try:
+            yield b"event: snapshot\ndata: " + current_weather + b"\n\n"
+            # a dropped (too slow) client is disconnected and resyncs on reconnect
+            while not subscriber.dropped:
+                event = await next_event(subscriber, STREAM_HEARTBEAT)
+                if event is not None:
+                    yield b"event: reading\ndata: " + event + b"\n\n"
+                elif await request.is_disconnected():
+                    break
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    latest_forecast = forecast_result.scalar_one_or_none()
-
-    forecast_data = None
-    if latest_forecast:
-        forecast_data = UserForecastResponseSchema(
-            forecast_id=latest_forecast.forecast_id,
-            forecast_date=latest_forecast.forecast_date,
-            city=latest_forecast.city,
-            temperature=latest_forecast.temperature,
-            humidity=latest_forecast.humidity,
-            wind=latest_forecast.wind,
-        ).model_dump()
-
-    #  final response
-    response_data = WeatherWidgetResponseSchema(
-        city=city,
-        current_weather=current_weather if latest_weather_data else None,
-        user_forecast=forecast_data
-    ).model_dump()
-
-    # store in Redis for 10min
-    await redis_client.setex(cache_key, timedelta(minutes=10).seconds, json.dumps(response_data, default=custom_json_serializer))
-
-    return response_data
@@ -1,7 +1,8 @@
 from schemas.station import StationSchema
 from schemas.sensor import IoTSensorSchema
 from schemas.measurement import (
-    IoTMeasurementSchema, IoTMeasurementInfoSchema, WeatherMeasurementSchema
+    IoTMeasurementSchema, IoTMeasurementInfoSchema, WeatherMeasurementSchema,
+    BulkIngestResponseSchema
 )
 from schemas.forecast import (
     UserForecastCreateSchema, UserForecastUpdateSchema, UserForecastResponseSchema
@@ -1,6 +1,11 @@
 import uuid
+from typing import List
 from pydantic import BaseModel, Field
 from datetime import datetime
+from models.ids import uuid7
+
+# weather_measurements.measurement_value is DECIMAL(10,2)
+MEASUREMENT_VALUE_LIMIT = 99999999.99
 
 # structure from IoT response
 class IoTMeasurementInfoSchema(BaseModel):
@@ -16,9 +21,21 @@ class IoTMeasurementSchema(BaseModel):
     info: IoTMeasurementInfoSchema
 
 class WeatherMeasurementSchema(BaseModel):
-    measurement_id: uuid.UUID = Field(default_factory=uuid.uuid4)
+    measurement_id: uuid.UUID = Field(default_factory=uuid7)
     sensor_id: str = Field(..., max_length=20)
-    measurement_value: float
+    measurement_value: float = Field(
+        ..., ge=-MEASUREMENT_VALUE_LIMIT, le=MEASUREMENT_VALUE_LIMIT, allow_inf_nan=False
+    )
     category: str = Field(..., pattern="^(Temperature|Humidity|Wind)$")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     unit: str = Field(..., max_length=20)
+
+class BulkIngestResponseSchema(BaseModel):
+    inserted: int
+    rejected: int
+    unknown_sensors: List[str] = []
+
+class QueuedIngestResponseSchema(BaseModel):
+    accepted: int
+    rejected: int
+    unknown_sensors: List[str] = []
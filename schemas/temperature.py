@@ -1,6 +1,6 @@
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import date
+from datetime import date, datetime
 
 class TemperatureRecordSchema(BaseModel):
     date: date
@@ -10,3 +10,19 @@ class TemperatureRecordSchema(BaseModel):
 class TemperatureVisualizationSchema(BaseModel):
     city: str
     temperature_history: List[TemperatureRecordSchema]
+
+class HistorySeriesSchema(BaseModel):
+    timestamp: List[datetime]
+    min: List[float]
+    max: List[float]
+    avg: List[float]
+    count: List[int]
+
+class TemperatureHistorySchema(BaseModel):
+    city: str
+    category: str
+    resolution: str
+    method: str
+    start: datetime
+    end: datetime
+    series: HistorySeriesSchema
@@ -1,5 +1,5 @@
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, Field
 from schemas.measurement import IoTMeasurementSchema
 from schemas.forecast import UserForecastResponseSchema
 
@@ -13,3 +13,6 @@ class WeatherWidgetResponseSchema(BaseModel):
     city: str
     current_weather: Optional[CurrentWeatherSchema] = None
     user_forecast: Optional[UserForecastResponseSchema] = None
+
+class WeatherBatchRequestSchema(BaseModel):
+    cities: List[str] = Field(..., min_length=1)
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable, Optional, Set
+from database import get_redis_pubsub
+from services.metrics import registry
+from services.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# every worker subscribes once and fans readings out to its own clients
+READINGS_CHANNEL = "readings:latest"
+# events buffered per client before it is considered too slow and dropped
+STREAM_CLIENT_BUFFER = int(os.getenv("STREAM_CLIENT_BUFFER", "100"))
+
+
+class Subscriber:
+    def __init__(self, station_codes: Iterable[str], buffer_size: int):
+        self.station_codes = set(station_codes)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+
+class BroadcastHub:
+    """Per-worker fan-out of station readings to bounded subscriber queues."""
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self.clients = 0
+        self.events_published = 0
+        self.events_delivered = 0
+        self.clients_dropped = 0
+
+    def subscribe(self, station_codes: Iterable[str]) -> Subscriber:
+        subscriber = Subscriber(station_codes, self.buffer_size)
+        for station_code in subscriber.station_codes:
+            self._subscribers.setdefault(station_code, set()).add(subscriber)
+        self.clients += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for station_code in subscriber.station_codes:
+            subscribers = self._subscribers.get(station_code)
+            if subscribers is None or subscriber not in subscribers:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[station_code]
+        if not subscriber.dropped:
+            self.clients -= 1
+
+    # encode once, hand the same bytes to every subscriber of the station;
+    # a subscriber whose buffer is full is cut off instead of slowing the rest
+    def publish(self, station_code: str, readings: dict):
+        subscribers = self._subscribers.get(station_code)
+        self.events_published += 1
+        if not subscribers:
+            return
+
+        event = dumps({"station_code": station_code, "readings": readings})
+        for subscriber in list(subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+                self.events_delivered += 1
+            except asyncio.QueueFull:
+                self.unsubscribe(subscriber)
+                subscriber.dropped = True
+                self.clients_dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "clients": self.clients,
+            "stations": len(self._subscribers),
+            "events_published": self.events_published,
+            "events_delivered": self.events_delivered,
+            "clients_dropped": self.clients_dropped,
+        }
+
+
+hub = BroadcastHub(STREAM_CLIENT_BUFFER)
+registry.gauge_callback("stream", "Live reading fan-out state", hub.stats)
+
+
+# message for READINGS_CHANNEL from {station_code: {category: serialized reading}}
+def readings_message(readings: Dict[str, Dict[str, bytes]]) -> bytes:
+    stations = [
+        dumps(station_code) + b":{"
+        + b",".join(dumps(category) + b":" + payload for category, payload in categories.items())
+        + b"}"
+        for station_code, categories in readings.items()
+    ]
+    return b"{" + b",".join(stations) + b"}"
+
+
+# deliver readings published by any worker to this worker's clients, reconnecting on failure
+async def listen_for_readings():
+    while True:
+        pubsub = None
+        try:
+            redis_client = await get_redis_pubsub()
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(READINGS_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                for station_code, readings in loads(message["data"]).items():
+                    hub.publish(station_code, readings)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("reading listener failed: %s", e)
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                await pubsub.reset()
+
+
+# next event for a subscriber, None on timeout so the caller can send a heartbeat
+async def next_event(subscriber: Subscriber, timeout: float) -> Optional[bytes]:
+    try:
+        return await asyncio.wait_for(subscriber.queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return None
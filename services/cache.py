@@ -0,0 +1,466 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+from fastapi import Request, Response
+from redis.exceptions import RedisError
+from database import get_redis, get_redis_binary, get_redis_pubsub, redis_pipeline
+from services.compression import (
+    COMPRESSION_MIN_SIZE, compress, encoded_etag, negotiate, run_compression, strip_etag_encoding
+)
+from services.metrics import cache_requests, cache_load_duration, registry
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# bounded in-process layer in front of redis for hot payloads
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "1024"))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "30"))
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# cross-worker single-flight: one worker recomputes a missing key under a short lease
+CACHE_LOCK_LEASE_MS = int(os.getenv("CACHE_LOCK_LEASE_MS", "5000"))
+CACHE_LOCK_POLL_MS = int(os.getenv("CACHE_LOCK_POLL_MS", "50"))
+# how long an expired payload may still be served while it is recomputed, 0 disables
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "60"))
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class LocalCache:
+    """TTL + LRU map of cache key to pre-serialized response bytes."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # drop every key whose city segment matches, e.g. forecasts:{city}:{limit}
+    def invalidate_city(self, city: str):
+        city = city.lower()
+        stale = [key for key in self._entries if key.split(":")[1:2] == [city]]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+local_cache = LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_TTL)
+registry.gauge_callback("local_cache", "In-process response cache state", local_cache.stats)
+# compressed variants of cached payloads, keyed by encoding and content hash
+compressed_cache = LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_TTL)
+registry.gauge_callback("compressed_cache", "In-process compressed payload cache state", compressed_cache.stats)
+# city -> (expires_at, generation), dropped with the city's local entries
+_generations = {}
+# concurrent misses in this worker share one computation per redis key
+_flights = SingleFlight()
+
+
+def drop_local(city: str):
+    local_cache.invalidate_city(city)
+    _generations.pop(city.lower(), None)
+
+
+# per-city generation counter, embedded in every redis cache key for that city
+def generation_key(city: str) -> str:
+    return f"cache:gen:{city.lower()}"
+
+
+# city segment of a cache key, e.g. forecasts:{city}:{limit}
+def key_city(key: str) -> str:
+    return key.split(":")[1]
+
+
+# family segment of a cache key: weather, forecasts or temperature
+def key_family(key: str) -> str:
+    return key.split(":")[0]
+
+
+async def get_generation(city: str) -> int:
+    city = city.lower()
+    cached = _generations.get(city)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    redis_client = await get_redis()
+    generation = int(await redis_client.get(generation_key(city)) or 0)
+    _generations[city] = (time.monotonic() + LOCAL_CACHE_TTL, generation)
+    return generation
+
+
+# redis key for a given generation of a logical cache key
+def versioned_key(key: str, generation: int) -> str:
+    return f"{key}:g{generation}"
+
+
+# local entries are only kept while no invalidation arrived for their city
+def is_current(city: str, generation: int) -> bool:
+    cached = _generations.get(city.lower())
+    return cached is not None and cached[1] == generation
+
+
+# compute and store a payload, plus a longer-lived stale copy for stale-while-revalidate
+async def _load_and_store(redis_key: str, ttl: int, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+    with cache_load_duration.time(family=key_family(redis_key)):
+        payload = await loader()
+    commands = [("setex", redis_key, ttl, payload)]
+    if CACHE_STALE_TTL:
+        commands.append(("setex", f"{redis_key}:stale", ttl + CACHE_STALE_TTL, payload))
+    await redis_pipeline(*commands)
+    return payload
+
+
+# one worker recomputes under a redis lease, the others serve the stale copy
+# or wait for the fresh one; returns (payload, is_fresh)
+async def _fill(redis_key: str, ttl: int, loader: Callable[[], Awaitable[bytes]]):
+    redis_client = await get_redis()
+    lock_key = f"lock:{redis_key}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + CACHE_LOCK_LEASE_MS / 1000
+    checked_stale = False
+
+    while True:
+        if await redis_client.set(lock_key, token, nx=True, px=CACHE_LOCK_LEASE_MS):
+            try:
+                return await _load_and_store(redis_key, ttl, loader), True
+            finally:
+                await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        cached_data = await redis_client.get(redis_key)
+        if cached_data:
+            return cached_data.encode(), True
+
+        if CACHE_STALE_TTL and not checked_stale:
+            checked_stale = True
+            stale_data = await redis_client.get(f"{redis_key}:stale")
+            if stale_data:
+                return stale_data.encode(), False
+
+        # the lock holder is stuck, stop waiting on it
+        if time.monotonic() >= deadline:
+            return await _load_and_store(redis_key, ttl, loader), True
+
+        await asyncio.sleep(CACHE_LOCK_POLL_MS / 1000)
+
+
+# serialized payload from the local cache, then redis, else computed by loader
+# and stored under the generation read before loading; concurrent misses for
+# the same key are coalesced within and across workers. While redis is down
+# the loader serves every local miss straight from the database.
+async def get_or_compute(key: str, ttl: int, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+    family = key_family(key)
+    payload = local_cache.get(key)
+    if payload is not None:
+        cache_requests.inc(family=family, layer="local", result="hit")
+        return payload
+    cache_requests.inc(family=family, layer="local", result="miss")
+
+    try:
+        return await _get_or_compute_shared(key, ttl, loader)
+    except RedisError as e:
+        cache_requests.inc(family=family, layer="redis", result="error")
+        logger.debug("redis unavailable for %s, loading from the database: %s", key, e)
+        return await loader()
+
+
+async def _get_or_compute_shared(key: str, ttl: int, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+    family = key_family(key)
+    city = key_city(key)
+    generation = await get_generation(city)
+    redis_key = versioned_key(key, generation)
+    redis_client = await get_redis()
+    cached_data = await redis_client.get(redis_key)
+    if cached_data:
+        cache_requests.inc(family=family, layer="redis", result="hit")
+        payload = cached_data.encode()
+        local_cache.set(key, payload)
+        return payload
+    cache_requests.inc(family=family, layer="redis", result="miss")
+
+    payload, is_fresh = await _flights.do(redis_key, lambda: _fill(redis_key, ttl, loader))
+    if is_fresh and is_current(city, generation):
+        local_cache.set(key, payload, ttl)
+    return payload
+
+
+async def get_generations(cities: List[str]) -> Dict[str, int]:
+    now = time.monotonic()
+    generations = {}
+    missing = []
+    for city in {city.lower() for city in cities}:
+        cached = _generations.get(city)
+        if cached and cached[0] > now:
+            generations[city] = cached[1]
+        else:
+            missing.append(city)
+
+    if missing:
+        redis_client = await get_redis()
+        values = await redis_client.mget([generation_key(city) for city in missing])
+        for city, value in zip(missing, values):
+            generations[city] = int(value or 0)
+            _generations[city] = (now + LOCAL_CACHE_TTL, generations[city])
+    return generations
+
+
+# batch variant of get_or_compute: local cache, one redis MGET for the rest,
+# then every miss computed by one loader call and stored in one pipeline;
+# misses are not coalesced across requests; without redis the loader gets every local miss
+async def get_or_compute_many(
+    keys: List[str], ttl: int, loader: Callable[[List[str]], Awaitable[Dict[str, bytes]]]
+) -> Dict[str, bytes]:
+    payloads: Dict[str, bytes] = {}
+    remaining = []
+    for key in keys:
+        payload = local_cache.get(key)
+        if payload is not None:
+            cache_requests.inc(family=key_family(key), layer="local", result="hit")
+            payloads[key] = payload
+        else:
+            cache_requests.inc(family=key_family(key), layer="local", result="miss")
+            remaining.append(key)
+    if not remaining:
+        return payloads
+
+    try:
+        payloads.update(await _get_or_compute_many_shared(remaining, ttl, loader))
+    except RedisError as e:
+        cache_requests.inc(family=key_family(remaining[0]), layer="redis", result="error")
+        logger.debug("redis unavailable for %d keys, loading from the database: %s", len(remaining), e)
+        payloads.update(await loader(remaining))
+    return payloads
+
+
+async def _get_or_compute_many_shared(
+    remaining: List[str], ttl: int, loader: Callable[[List[str]], Awaitable[Dict[str, bytes]]]
+) -> Dict[str, bytes]:
+    payloads: Dict[str, bytes] = {}
+    generations = await get_generations([key_city(key) for key in remaining])
+    redis_keys = {key: versioned_key(key, generations[key_city(key)]) for key in remaining}
+    redis_client = await get_redis()
+    values = await redis_client.mget([redis_keys[key] for key in remaining])
+
+    misses = []
+    for key, value in zip(remaining, values):
+        if value:
+            cache_requests.inc(family=key_family(key), layer="redis", result="hit")
+            payloads[key] = value.encode()
+            local_cache.set(key, payloads[key])
+        else:
+            cache_requests.inc(family=key_family(key), layer="redis", result="miss")
+            misses.append(key)
+    if not misses:
+        return payloads
+
+    with cache_load_duration.time(family=key_family(misses[0])):
+        loaded = await loader(misses)
+    commands = []
+    for key in misses:
+        commands.append(("setex", redis_keys[key], ttl, loaded[key]))
+        if CACHE_STALE_TTL:
+            commands.append(("setex", f"{redis_keys[key]}:stale", ttl + CACHE_STALE_TTL, loaded[key]))
+    await redis_pipeline(*commands)
+
+    for key in misses:
+        payloads[key] = loaded[key]
+        city = key_city(key)
+        if is_current(city, generations[city]):
+            local_cache.set(key, loaded[key], ttl)
+    return payloads
+
+
+# remaining redis TTL in ms of each key's current version (-2 when missing), one round trip
+async def remaining_ttls(keys: List[str]) -> Dict[str, int]:
+    generations = await get_generations([key_city(key) for key in keys])
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.pttl(versioned_key(key, generations[key_city(key)]))
+        ttls = await pipe.execute()
+    return dict(zip(keys, ttls))
+
+
+# recompute a key ahead of its expiry under the same lease as misses, so only
+# one worker refreshes it; False when another worker already holds the lease
+async def refresh(key: str, ttl: int, loader: Callable[[], Awaitable[bytes]]) -> bool:
+    city = key_city(key)
+    generation = await get_generation(city)
+    redis_key = versioned_key(key, generation)
+    redis_client = await get_redis()
+    lock_key = f"lock:{redis_key}"
+    token = uuid.uuid4().hex
+    if not await redis_client.set(lock_key, token, nx=True, px=CACHE_LOCK_LEASE_MS):
+        return False
+
+    try:
+        payload = await _load_and_store(redis_key, ttl, loader)
+    finally:
+        await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+    if is_current(city, generation):
+        local_cache.set(key, payload, ttl)
+    return True
+
+
+# retire every cached payload of a city: bump its generation so new keys are
+# used, old ones simply expire, and tell every other worker to drop local
+# copies, in one round trip; the write is already committed, so a redis
+# outage is only logged and other workers catch up through their TTLs
+async def invalidate_city(city: str):
+    city = city.lower()
+    drop_local(city)
+    try:
+        await redis_pipeline(("incr", generation_key(city)), ("publish", INVALIDATION_CHANNEL, city))
+    except RedisError as e:
+        logger.warning("failed to invalidate cache for %s: %s", city, e)
+
+
+# strong validator of a serialized payload
+def etag(payload: bytes) -> str:
+    return '"' + hashlib.blake2b(payload, digest_size=16).hexdigest() + '"'
+
+
+# If-None-Match may list several tags, weak ones included, or be *
+def etag_matches(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(
+        strip_etag_encoding(candidate.strip().removeprefix("W/")) == tag for candidate in header.split(",")
+    )
+
+
+# compressed payload, stored in redis under its content hash so every worker
+# reuses it instead of compressing the same bytes again
+async def compressed_variant(payload: bytes, tag: str, encoding: str, ttl: int) -> bytes:
+    digest = tag.strip('"')
+    key = f"compressed:{encoding}:{digest}"
+    data = compressed_cache.get(key)
+    if data is not None:
+        return data
+
+    try:
+        redis_client = await get_redis_binary()
+        data = await redis_client.get(key)
+        if data is None:
+            data = await run_compression(compress, payload, encoding)
+            await redis_client.setex(key, ttl, data)
+    except RedisError as e:
+        logger.debug("redis unavailable, compressing %s locally: %s", key, e)
+        data = await run_compression(compress, payload, encoding)
+    compressed_cache.set(key, data, ttl)
+    return data
+
+
+# cached payloads are already JSON, skip response_model re-encoding; with a
+# request the response carries an ETag, unchanged payloads are answered with
+# an empty 304 and large ones are compressed in the negotiated encoding, stored
+# for variant_ttl seconds when given; max_age lets browsers and CDNs reuse it
+async def cached_response(
+    payload: bytes,
+    request: Optional[Request] = None,
+    max_age: Optional[int] = None,
+    variant_ttl: Optional[int] = None,
+) -> Response:
+    headers = {}
+    if max_age is not None:
+        headers["Cache-Control"] = f"public, max-age={max_age}"
+    if request is None:
+        return Response(content=payload, media_type="application/json", headers=headers)
+
+    tag = etag(payload)
+    encoding = None
+    if len(payload) >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        headers["Vary"] = "Accept-Encoding"
+    headers["ETag"] = encoded_etag(tag, encoding) if encoding else tag
+    if etag_matches(request, tag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        if variant_ttl:
+            payload = await compressed_variant(payload, tag, encoding, variant_ttl)
+        else:
+            payload = await run_compression(compress, payload, encoding)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
+# apply invalidations published by any worker, reconnecting on failure
+async def listen_for_invalidations():
+    while True:
+        pubsub = None
+        try:
+            redis_client = await get_redis_pubsub()
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    drop_local(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # entries we missed updates for can't be trusted anymore
+            local_cache.clear()
+            _generations.clear()
+            logger.warning("cache invalidation listener failed: %s", e)
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                await pubsub.reset()
@@ -0,0 +1,216 @@
+import asyncio
+import gzip
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# brotli and zstd are optional, gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# bodies smaller than this are sent as is, compressing them costs more than it saves
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+# larger bodies and chunks are compressed in a thread instead of on the event loop
+COMPRESSION_THREAD_SIZE = int(os.getenv("COMPRESSION_THREAD_SIZE", "65536"))
+
+# server preference when the client accepts several with the same q-value
+ENCODINGS = tuple(
+    encoding for encoding, available in (("zstd", zstandard), ("br", brotli), ("gzip", True)) if available
+)
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/xml", "application/javascript")
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"unsupported encoding {encoding}")
+
+
+class StreamCompressor:
+    """Incremental compressor for bodies sent in several chunks."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"unsupported encoding {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+# best encoding the client accepts, None for identity
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+# compression runs at tens of MB/s, keep big inputs off the event loop
+async def run_compression(fn, data: bytes, *args) -> bytes:
+    if len(data) >= COMPRESSION_THREAD_SIZE:
+        return await asyncio.to_thread(fn, data, *args)
+    return fn(data, *args)
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+
+# a representation's ETag differs per content coding
+def encoded_etag(tag: str, encoding: str) -> str:
+    return f'{tag[:-1]}-{encoding}"' if tag.endswith('"') else tag
+
+
+def strip_etag_encoding(tag: str) -> str:
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if "accept-encoding" in vary.lower():
+        return headers
+    return [(key, value) for key, value in headers if key.lower() != b"vary"] + [
+        (b"vary", f"{vary}, Accept-Encoding".encode("latin-1"))
+    ]
+
+
+class CompressionMiddleware:
+    """Negotiated zstd/br/gzip compression of text responses above a size
+    threshold. Single-body responses are compressed at once, streamed ones
+    chunk by chunk; event streams and already encoded bodies pass through."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(_header(scope["headers"], b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if (
+                    _header(headers, b"content-encoding") is not None
+                    or not is_compressible(_header(headers, b"content-type") or "")
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                # held back until the first body chunk shows whether it is worth compressing
+                start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = [
+                    (key, value) for key, value in start.get("headers", [])
+                    if key.lower() != b"content-length"
+                ]
+                if not more_body:
+                    if len(body) < self.minimum_size:
+                        passthrough = True
+                        await send(start)
+                        await send(message)
+                        return
+                    body = await run_compression(compress, body, encoding)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                else:
+                    compressor = StreamCompressor(encoding)
+                    body = await run_compression(compressor.compress, body)
+
+                etag = _header(headers, b"etag")
+                if etag is not None:
+                    headers = [(key, value) for key, value in headers if key.lower() != b"etag"]
+                    headers.append((b"etag", encoded_etag(etag, encoding).encode("latin-1")))
+                headers.append((b"content-encoding", encoding.encode()))
+                await send({**start, "headers": _vary(headers)})
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            body = await run_compression(compressor.compress, body)
+            if not more_body:
+                body += compressor.finish()
+            # skip empty chunks the compressor is still buffering
+            if body or not more_body:
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
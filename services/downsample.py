@@ -0,0 +1,94 @@
+from typing import Dict
+import numpy as np
+
+# seconds per bucket for each supported resolution
+RESOLUTION_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+class BucketAccumulator:
+    """Fixed time grid of min/max/sum/count, fed chunk by chunk.
+
+    Memory is bounded by the number of buckets, not by the number of rows,
+    so arbitrarily long results can be streamed through it."""
+
+    def __init__(self, start: int, end: int, step: int):
+        self.start = start
+        self.step = step
+        self.size = max(0, -(-(end - start) // step))
+        self.min = np.full(self.size, np.inf)
+        self.max = np.full(self.size, -np.inf)
+        self.sum = np.zeros(self.size)
+        self.count = np.zeros(self.size, dtype=np.int64)
+
+    # epoch seconds of each row (or of its pre-aggregated bucket) plus its aggregates
+    def add(self, timestamps, mins, maxs, sums, counts):
+        index = (np.asarray(timestamps, dtype=np.int64) - self.start) // self.step
+        inside = (index >= 0) & (index < self.size)
+        index = index[inside]
+        np.minimum.at(self.min, index, np.asarray(mins, dtype=np.float64)[inside])
+        np.maximum.at(self.max, index, np.asarray(maxs, dtype=np.float64)[inside])
+        np.add.at(self.sum, index, np.asarray(sums, dtype=np.float64)[inside])
+        np.add.at(self.count, index, np.asarray(counts, dtype=np.int64)[inside])
+
+    def add_values(self, timestamps, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.add(timestamps, values, values, values, np.ones(len(values), dtype=np.int64))
+
+    # non-empty buckets as arrays keyed timestamp/min/max/avg/count
+    def series(self) -> Dict[str, np.ndarray]:
+        filled = self.count > 0
+        return {
+            "timestamp": self.start + np.flatnonzero(filled) * self.step,
+            "min": self.min[filled],
+            "max": self.max[filled],
+            "avg": self.sum[filled] / self.count[filled],
+            "count": self.count[filled],
+        }
+
+
+# merge a series into at most max_points equal-width time buckets,
+# keeping the true min/max and the count weighted average
+def rebucket(series: Dict[str, np.ndarray], start: int, end: int, max_points: int) -> Dict[str, np.ndarray]:
+    if len(series["timestamp"]) <= max_points:
+        return series
+
+    step = -(-(end - start) // max_points)
+    accumulator = BucketAccumulator(start, end, step)
+    accumulator.add(
+        series["timestamp"], series["min"], series["max"],
+        series["avg"] * series["count"], series["count"],
+    )
+    return accumulator.series()
+
+
+# Largest-Triangle-Three-Buckets on the averages: keeps max_points of the
+# original points (first and last always) that preserve the visual shape
+def lttb(series: Dict[str, np.ndarray], max_points: int) -> Dict[str, np.ndarray]:
+    length = len(series["timestamp"])
+    if length <= max_points or max_points < 3:
+        return series
+
+    x = series["timestamp"].astype(np.float64)
+    y = series["avg"]
+    # bucket edges over the points between the first and the last one
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+
+    previous = 0
+    for bucket in range(max_points - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        # average of the next bucket is the third triangle vertex
+        next_low, next_high = high, edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[next_low:max(next_high, next_low + 1)].mean()
+        next_y = y[next_low:max(next_high, next_low + 1)].mean()
+
+        candidates = slice(low, max(high, low + 1))
+        areas = np.abs(
+            (x[previous] - next_x) * (y[candidates] - y[previous])
+            - (x[previous] - x[candidates]) * (next_y - y[previous])
+        )
+        previous = low + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return {name: values[selected] for name, values in series.items()}
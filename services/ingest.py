@@ -0,0 +1,101 @@
+import asyncio
+import os
+from typing import List, Tuple
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models.measurement import WeatherMeasurement
+from services.rollups import update_rollups
+
+MEASUREMENT_COLUMNS = ("measurement_id", "sensor_id", "measurement_value", "category", "timestamp", "unit")
+ROW_COLUMNS = MEASUREMENT_COLUMNS + ("station_code",)
+
+# postgres allows at most 32767 bind parameters per statement
+MAX_INSERT_ROWS = 32767 // len(ROW_COLUMNS)
+INGEST_BATCH_SIZE = min(int(os.getenv("INGEST_BATCH_SIZE", "5000")), MAX_INSERT_ROWS)
+
+
+# errors caused by the rows themselves (a value out of range, an unknown
+# sensor, ...), retrying the same rows can never succeed; asyncpg reports
+# most of them as plain DBAPIError, so the SQLSTATE class decides: 22 data
+# exception, 23 integrity constraint violation
+def is_row_error(error: BaseException) -> bool:
+    if isinstance(error, (DataError, IntegrityError)):
+        return True
+    return _sqlstate(error).startswith(("22", "23"))
+
+
+# postgres unreachable, restarting or out of connections, the same rows can
+# succeed later: SQLSTATE 08 connection exception, 53 insufficient resources,
+# 57P shutdown or still starting up
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (OSError, asyncio.TimeoutError, PoolTimeoutError)):
+        return True
+    if not isinstance(error, DBAPIError):
+        return False
+    return (
+        error.connection_invalidated
+        or isinstance(error, (OperationalError, InterfaceError))
+        or isinstance(error.orig, OSError)
+        or _sqlstate(error).startswith(("08", "53", "57P"))
+    )
+
+
+def _sqlstate(error: BaseException) -> str:
+    return getattr(getattr(error, "orig", None), "sqlstate", None) or ""
+
+
+# plain row dict ready for a multi-row insert
+def measurement_row(measurement, station_code: str) -> dict:
+    row = {column: getattr(measurement, column) for column in MEASUREMENT_COLUMNS}
+    row["station_code"] = station_code
+    return row
+
+
+# write measurement rows with one multi-row INSERT per batch and fold them
+# into the rollups in the same transaction, caller commits; with skip_existing
+# rows whose measurement_id is already stored are ignored (safe to replay)
+async def write_measurements(db: AsyncSession, rows: List[dict], skip_existing: bool = False) -> int:
+    written = 0
+    for start in range(0, len(rows), INGEST_BATCH_SIZE):
+        batch = rows[start:start + INGEST_BATCH_SIZE]
+        if skip_existing:
+            result = await db.execute(
+                pg_insert(WeatherMeasurement).values(batch)
+                .on_conflict_do_nothing(index_elements=[WeatherMeasurement.measurement_id, WeatherMeasurement.timestamp])
+                .returning(WeatherMeasurement.measurement_id)
+            )
+            inserted = {str(measurement_id) for measurement_id in result.scalars()}
+            batch = [row for row in batch if str(row["measurement_id"]) in inserted]
+        else:
+            await db.execute(insert(WeatherMeasurement).values(batch))
+        if batch:
+            await update_rollups(db, batch)
+        written += len(batch)
+    return written
+
+
+# write rows in their own transaction, skipping ids already stored; a batch the
+# database rejects because of its data is split in halves until the offending
+# rows are isolated, so they don't take the rest of the batch with them.
+# Returns (rows written, rows committed, [(rejected row, error)]); any other
+# error (connection lost, ...) is raised and the caller may retry every row
+async def write_isolating_bad_rows(rows: List[dict]) -> Tuple[int, List[dict], List[Tuple[dict, Exception]]]:
+    try:
+        async with AsyncSessionLocal() as session:
+            written = await write_measurements(session, rows, skip_existing=True)
+            await session.commit()
+        return written, rows, []
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(rows) == 1:
+            return 0, [], [(rows[0], e)]
+
+    middle = len(rows) // 2
+    written, stored, rejected = await write_isolating_bad_rows(rows[:middle])
+    more_written, more_stored, more_rejected = await write_isolating_bad_rows(rows[middle:])
+    return written + more_written, stored + more_stored, rejected + more_rejected
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import List, Optional
+from services.ingest import INGEST_BATCH_SIZE, write_isolating_bad_rows
+from services.latest import update_latest
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# rows buffered between producers and writers before producers are pushed back
+INGEST_QUEUE_MAX_ROWS = int(os.getenv("INGEST_QUEUE_MAX_ROWS", "50000"))
+INGEST_CONSUMERS = int(os.getenv("INGEST_CONSUMERS", "4"))
+# how long a consumer waits for a partial batch to fill up before writing it
+INGEST_LINGER_MS = int(os.getenv("INGEST_LINGER_MS", "50"))
+INGEST_WRITE_RETRIES = int(os.getenv("INGEST_WRITE_RETRIES", "3"))
+# how long shutdown waits for queued rows to be written
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "30"))
+# window the reported write rate is averaged over, in seconds
+INGEST_RATE_WINDOW = 60.0
+
+ingest_write_duration = registry.histogram(
+    "ingest_batch_write_duration_seconds", "Time to write and commit one queued measurement batch")
+
+
+class IngestQueueFull(Exception):
+    """The queue has no room for the rows, the producer should retry later."""
+
+
+class IngestUnavailable(Exception):
+    """The pipeline is not running or is draining for shutdown."""
+
+
+class IngestPipeline:
+    """Bounded queue of measurement rows drained by a pool of batch-writing consumers."""
+
+    def __init__(self, max_rows: int, consumers: int, batch_size: int, linger_ms: int, retries: int):
+        self.max_rows = max_rows
+        self.consumers = consumers
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.retries = retries
+        # optional write-behind buffer batches are handed to instead of written
+        self.sink = None
+        self.accepting = False
+        self.rows_enqueued = 0
+        self.rows_rejected = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches_written = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._writes: deque = deque()
+        self._started = 0.0
+
+    # hand batches to a write-behind buffer instead of writing them; rows only
+    # count as written once the buffer has committed them
+    def attach_sink(self, sink):
+        self.sink = sink
+        sink.on_written = self._record_write
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_rows)
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.consumers)]
+        self._started = time.monotonic()
+        self.accepting = True
+
+    # stop taking rows, give the consumers `timeout` seconds to write what is queued
+    async def stop(self, timeout: float = INGEST_DRAIN_TIMEOUT):
+        self.accepting = False
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("ingest drain timed out, dropping %d queued rows", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # enqueue all rows or none of them, without waiting (HTTP producers)
+    def offer(self, rows: List[dict]):
+        if not self.accepting:
+            raise IngestUnavailable()
+        if self._queue.maxsize - self._queue.qsize() < len(rows):
+            self.rows_rejected += len(rows)
+            raise IngestQueueFull()
+
+        for row in rows:
+            self._queue.put_nowait(row)
+        self.rows_enqueued += len(rows)
+
+    # enqueue rows, waiting for room while the writers catch up (internal producers)
+    async def put(self, rows: List[dict]):
+        for row in rows:
+            if not self.accepting:
+                raise IngestUnavailable()
+            await self._queue.put(row)
+            self.rows_enqueued += 1
+
+    async def _consume(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain_into(batch)
+            if len(batch) < self.batch_size and self.linger:
+                await asyncio.sleep(self.linger)
+                self._drain_into(batch)
+
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _drain_into(self, batch: List[dict]):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    # write one batch, retrying transient failures with backoff; rows the
+    # database rejects are dropped on their own, the rest of the batch is kept
+    async def _write(self, batch: List[dict]):
+        if self.sink is not None:
+            # waits while the buffer is full, so the queue backs up and producers get pushed back
+            await self.sink.add(batch)
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                with ingest_write_duration.time():
+                    written, stored, rejected = await write_isolating_bad_rows(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if attempt == self.retries:
+                    self.rows_failed += len(batch)
+                    logger.exception("dropping %d measurements after %d attempts", len(batch), attempt + 1)
+                    return
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 2.0))
+            else:
+                if rejected:
+                    self.rows_failed += len(rejected)
+                    logger.warning(
+                        "dropping %d of %d measurements rejected by the database, e.g. %s: %s",
+                        len(rejected), len(batch), rejected[0][0]["measurement_id"], rejected[0][1],
+                    )
+                self._record_write(written)
+                await update_latest(stored)
+                return
+
+    def _record_write(self, count: int):
+        self.rows_written += count
+        self.batches_written += 1
+        self._writes.append((time.monotonic(), count))
+
+    def write_rate(self) -> float:
+        now = time.monotonic()
+        while self._writes and self._writes[0][0] < now - INGEST_RATE_WINDOW:
+            self._writes.popleft()
+        window = min(INGEST_RATE_WINDOW, now - self._started) if self._started else 0.0
+        return sum(count for _, count in self._writes) / window if window > 0 else 0.0
+
+    def status(self) -> dict:
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "accepting": self.accepting,
+            "queue_depth": depth,
+            "queue_capacity": self.max_rows,
+            "queue_utilization": depth / self.max_rows if self.max_rows else 0.0,
+            "consumers": len(self._tasks),
+            "rows_enqueued": self.rows_enqueued,
+            "rows_rejected": self.rows_rejected,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "batches_written": self.batches_written,
+            "write_rate_rows_per_sec": self.write_rate(),
+        }
+
+
+ingest_pipeline = IngestPipeline(
+    INGEST_QUEUE_MAX_ROWS, INGEST_CONSUMERS, INGEST_BATCH_SIZE, INGEST_LINGER_MS, INGEST_WRITE_RETRIES
+)
+registry.gauge_callback("ingest", "Background ingest queue state", ingest_pipeline.status)
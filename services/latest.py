@@ -0,0 +1,128 @@
+import logging
+from typing import Dict, Iterable, List, Tuple
+from database import get_redis
+from services.broadcast import READINGS_CHANNEL, readings_message
+from services.rollups import as_utc
+from services.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("temperature", "humidity", "wind")
+
+# per station hash: {category} -> serialized reading, {category}:ts -> epoch seconds;
+# a reading only replaces one that is not newer, so late batches can't regress it
+UPDATE_LATEST_SCRIPT = """
+for i = 1, #ARGV, 3 do
+    local current = redis.call("hget", KEYS[1], ARGV[i] .. ":ts")
+    if not current or tonumber(current) <= tonumber(ARGV[i + 1]) then
+        redis.call("hset", KEYS[1], ARGV[i], ARGV[i + 2], ARGV[i] .. ":ts", ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+
+def latest_key(station_code: str) -> str:
+    return f"latest:{station_code}"
+
+
+# reading in the widget's IoTMeasurementSchema shape, pre-serialized
+def serialize_reading(row: dict) -> bytes:
+    return dumps({
+        "measurement_id": row["measurement_id"],
+        "sensor_id": row["sensor_id"],
+        "date": as_utc(row["timestamp"]),
+        "station": row["sensor_id"].split("-")[0],
+        "info": {
+            "category": row["category"],
+            # stored as DECIMAL(10,2), keep live and database readings identical
+            "measurement": round(float(row["measurement_value"]), 2),
+            "unit": row["unit"],
+        },
+    })
+
+
+# newest row per (station, category) of a batch
+def newest_per_station(rows: Iterable[dict]) -> Dict[str, Dict[str, dict]]:
+    newest: Dict[str, Dict[str, dict]] = {}
+    for row in rows:
+        categories = newest.setdefault(row["station_code"], {})
+        category = row["category"].lower()
+        current = categories.get(category)
+        if current is None or as_utc(row["timestamp"]) >= as_utc(current["timestamp"]):
+            categories[category] = row
+    return newest
+
+
+# fold committed measurement rows into the live state and push them to stream
+# subscribers, one pipelined round trip; failures are logged only, the rows are already stored
+async def update_latest(rows: List[dict], publish: bool = True):
+    if not rows:
+        return
+
+    try:
+        newest = newest_per_station(rows)
+        readings = {
+            station_code: {category: serialize_reading(row) for category, row in categories.items()}
+            for station_code, categories in newest.items()
+        }
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for station_code, categories in readings.items():
+                args = []
+                for category, payload in categories.items():
+                    row = newest[station_code][category]
+                    args += [category, as_utc(row["timestamp"]).timestamp(), payload]
+                pipe.eval(UPDATE_LATEST_SCRIPT, 1, latest_key(station_code), *args)
+            if publish:
+                pipe.publish(READINGS_CHANNEL, readings_message(readings))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("failed to update latest readings: %s", e)
+
+
+# live state per station: {station_code: {category: (payload, timestamp)}};
+# stations without live state yet are returned as missing
+async def get_station_latest(station_codes: List[str]) -> Tuple[Dict[str, Dict[str, Tuple[str, float]]], List[str]]:
+    if not station_codes:
+        return {}, []
+
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for station_code in station_codes:
+            pipe.hgetall(latest_key(station_code))
+        states = await pipe.execute()
+
+    latest: Dict[str, Dict[str, Tuple[str, float]]] = {}
+    missing = []
+    for station_code, state in zip(station_codes, states):
+        if not state:
+            missing.append(station_code)
+            continue
+        latest[station_code] = {
+            category: (state[category], float(state[f"{category}:ts"]))
+            for category in CATEGORIES
+            if category in state
+        }
+    return latest, missing
+
+
+# live state shaped like get_station_latest, built from stored rows while redis is down
+def states_from_rows(rows: Iterable[dict]) -> Dict[str, Dict[str, Tuple[str, float]]]:
+    return {
+        station_code: {
+            category: (serialize_reading(row).decode(), as_utc(row["timestamp"]).timestamp())
+            for category, row in categories.items()
+        }
+        for station_code, categories in newest_per_station(rows).items()
+    }
+
+
+# newest reading per category across some stations
+def merge_latest(states: Dict[str, Dict[str, Tuple[str, float]]], station_codes: List[str]) -> Dict[str, Tuple[str, float]]:
+    latest: Dict[str, Tuple[str, float]] = {}
+    for station_code in station_codes:
+        for category, reading in states.get(station_code, {}).items():
+            if category not in latest or reading[1] > latest[category][1]:
+                latest[category] = reading
+    return latest
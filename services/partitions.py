@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "weather_measurements"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+# "day" or "month" range partitions on weather_measurements.timestamp (UTC)
+MEASUREMENT_PARTITION_INTERVAL = os.getenv("MEASUREMENT_PARTITION_INTERVAL", "day")
+# partitions created ahead of time so inserts never land in the default partition
+MEASUREMENT_PARTITION_PREMAKE = int(os.getenv("MEASUREMENT_PARTITION_PREMAKE", "7"))
+# days of raw measurements kept, 0 (the default) keeps everything; rollups are not affected
+MEASUREMENT_RETENTION_DAYS = int(os.getenv("MEASUREMENT_RETENTION_DAYS", "0"))
+# "detach" expired partitions and leave the tables for archiving, or "drop" them
+MEASUREMENT_RETENTION_ACTION = os.getenv("MEASUREMENT_RETENTION_ACTION", "detach")
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+# serializes maintenance across workers, key is arbitrary but fixed
+MAINTENANCE_LOCK_ID = 7_260_418
+
+PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_p(\d{{6}}|\d{{8}})$")
+
+
+def partition_start(day: date, interval: str = MEASUREMENT_PARTITION_INTERVAL) -> date:
+    return day.replace(day=1) if interval == "month" else day
+
+
+def next_partition_start(start: date, interval: str = MEASUREMENT_PARTITION_INTERVAL) -> date:
+    if interval == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start: date, interval: str = MEASUREMENT_PARTITION_INTERVAL) -> str:
+    return f"{PARENT_TABLE}_p{start.strftime('%Y%m' if interval == 'month' else '%Y%m%d')}"
+
+
+# (start, end) of a partition from its name, end exclusive
+def partition_range(name: str) -> Tuple[date, date]:
+    suffix = PARTITION_NAME.match(name).group(1)
+    if len(suffix) == 6:
+        start = datetime.strptime(suffix, "%Y%m").date()
+        return start, next_partition_start(start, "month")
+    start = datetime.strptime(suffix, "%Y%m%d").date()
+    return start, next_partition_start(start, "day")
+
+
+def create_partition_sql(start: date, interval: str = MEASUREMENT_PARTITION_INTERVAL) -> str:
+    end = next_partition_start(start, interval)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start, interval)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+    )
+
+
+def partition_bounds(start: date, interval: str = MEASUREMENT_PARTITION_INTERVAL) -> Tuple[datetime, datetime]:
+    end = next_partition_start(start, interval)
+    return (
+        datetime.combine(start, datetime.min.time(), timezone.utc),
+        datetime.combine(end, datetime.min.time(), timezone.utc),
+    )
+
+
+async def default_has_rows(conn, start: date) -> bool:
+    lower, upper = partition_bounds(start)
+    result = await conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper)"
+    ), {"lower": lower, "upper": upper})
+    return bool(result.scalar())
+
+
+# readings dated past the pre-created range land in the default partition, and
+# postgres refuses to create a partition whose range the default already holds
+# rows for; detach the default, create the partitions, move those rows into
+# them and attach the default again, all in the caller's transaction
+async def create_partitions_over_default(conn, starts: List[date]):
+    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    for start in starts:
+        await conn.execute(text(create_partition_sql(start)))
+        lower, upper = partition_bounds(start)
+        result = await conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper RETURNING *
+            )
+            INSERT INTO {PARENT_TABLE} SELECT * FROM moved
+        """), {"lower": lower, "upper": upper})
+        if result.rowcount:
+            logger.info("moved %d measurements from %s into %s", result.rowcount, DEFAULT_PARTITION, partition_name(start))
+    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+async def list_partitions(conn) -> List[str]:
+    result = await conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :parent
+    """), {"parent": PARENT_TABLE})
+    return [name for name in result.scalars() if PARTITION_NAME.match(name)]
+
+
+# create the partitions from `since` (default today) up to MEASUREMENT_PARTITION_PREMAKE
+# days ahead and drop or detach the ones entirely older than MEASUREMENT_RETENTION_DAYS
+async def maintain_partitions(today: Optional[date] = None, since: Optional[date] = None) -> dict:
+    today = today or datetime.now(timezone.utc).date()
+    created, expired = [], []
+
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+        existing = set(await list_partitions(conn))
+
+        await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+        start = partition_start(min(since or today, today))
+        horizon = today + timedelta(days=MEASUREMENT_PARTITION_PREMAKE)
+        missing = []
+        while start <= horizon:
+            if partition_name(start) not in existing:
+                missing.append(start)
+            start = next_partition_start(start)
+
+        overlapping = [start for start in missing if await default_has_rows(conn, start)]
+        for start in missing:
+            if start not in overlapping:
+                await conn.execute(text(create_partition_sql(start)))
+        if overlapping:
+            await create_partitions_over_default(conn, overlapping)
+        created = [partition_name(start) for start in missing]
+
+        if MEASUREMENT_RETENTION_DAYS:
+            cutoff = today - timedelta(days=MEASUREMENT_RETENTION_DAYS)
+            for name in sorted(existing):
+                if partition_range(name)[1] > cutoff:
+                    continue
+                if MEASUREMENT_RETENTION_ACTION == "detach":
+                    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                else:
+                    await conn.execute(text(f"DROP TABLE {name}"))
+                expired.append(name)
+
+    if created or expired:
+        logger.info("measurement partitions created %s, %s %s", created, MEASUREMENT_RETENTION_ACTION, expired)
+    return {"created": created, "expired": expired}
+
+
+# periodic maintenance, the first run is expected at startup
+async def run_partition_maintenance():
+    while True:
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+        try:
+            await maintain_partitions()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("partition maintenance failed: %s", e)
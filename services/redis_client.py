@@ -0,0 +1,96 @@
+import time
+from typing import Optional, Tuple
+from redis.exceptions import ConnectionError, TimeoutError
+from services.metrics import InstrumentedPipeline, InstrumentedRedis
+
+
+class RedisUnavailable(ConnectionError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive connection errors, so callers fail
+    fast and fall back instead of waiting on timeouts; after `cooldown`
+    seconds calls go through again and the first failure re-opens it."""
+
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def check(self):
+        if self.state == "open":
+            self.rejected += 1
+            raise RedisUnavailable("redis circuit breaker is open")
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.opened_at is not None or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        state = self.state
+        return {
+            "open": state == "open",
+            "half_open": state == "half_open",
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+# errors that say redis itself is unreachable, not that a command was wrong
+BREAKER_ERRORS: Tuple[type, ...] = (ConnectionError, TimeoutError)
+
+
+class ManagedPipeline(InstrumentedPipeline):
+    breaker: CircuitBreaker
+
+    async def execute(self, raise_on_error: bool = True):
+        self.breaker.check()
+        try:
+            result = await super().execute(raise_on_error)
+        except BREAKER_ERRORS:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+
+class ManagedRedis(InstrumentedRedis):
+    """Instrumented client that reports to a circuit breaker and refuses
+    commands while it is open."""
+
+    breaker: CircuitBreaker
+
+    async def execute_command(self, *args, **options):
+        self.breaker.check()
+        try:
+            result = await super().execute_command(*args, **options)
+        except BREAKER_ERRORS:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> ManagedPipeline:
+        pipe = ManagedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
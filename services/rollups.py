@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from typing import List
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.rollup import MeasurementRollupHourly, MeasurementRollupDaily
+
+# postgres allows at most 32767 bind parameters per statement
+MAX_UPSERT_ROWS = 32767 // 10
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    # naive timestamps are written as UTC by the ingest path
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return as_utc(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(timestamp: datetime):
+    return as_utc(timestamp).date()
+
+
+# fold a batch of measurement rows into one aggregate per (sensor, category, bucket)
+def aggregate_rows(rows: List[dict], bucket_fn) -> List[dict]:
+    aggregates = {}
+    for row in rows:
+        timestamp = as_utc(row["timestamp"])
+        value = float(row["measurement_value"])
+        key = (row["sensor_id"], row["category"], bucket_fn(timestamp))
+
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregates[key] = {
+                "sensor_id": key[0],
+                "category": key[1],
+                "bucket": key[2],
+                "station_code": row["station_code"],
+                "min_value": value,
+                "max_value": value,
+                "sum_value": value,
+                "sample_count": 1,
+                "last_value": value,
+                "last_timestamp": timestamp,
+            }
+            continue
+
+        aggregate["min_value"] = min(aggregate["min_value"], value)
+        aggregate["max_value"] = max(aggregate["max_value"], value)
+        aggregate["sum_value"] += value
+        aggregate["sample_count"] += 1
+        if timestamp >= aggregate["last_timestamp"]:
+            aggregate["last_value"] = value
+            aggregate["last_timestamp"] = timestamp
+
+    # stable key order keeps concurrent upserts from deadlocking
+    return [aggregates[key] for key in sorted(aggregates)]
+
+
+async def _upsert(db: AsyncSession, model, aggregates: List[dict]):
+    for start in range(0, len(aggregates), MAX_UPSERT_ROWS):
+        await db.execute(_upsert_statement(model, aggregates[start:start + MAX_UPSERT_ROWS]))
+
+
+def _upsert_statement(model, aggregates: List[dict]):
+    stmt = pg_insert(model).values(aggregates)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.sensor_id, model.category, model.bucket],
+        set_={
+            "min_value": func.least(model.min_value, excluded.min_value),
+            "max_value": func.greatest(model.max_value, excluded.max_value),
+            "sum_value": model.sum_value + excluded.sum_value,
+            "sample_count": model.sample_count + excluded.sample_count,
+            "last_value": case(
+                (excluded.last_timestamp >= model.last_timestamp, excluded.last_value),
+                else_=model.last_value
+            ),
+            "last_timestamp": func.greatest(model.last_timestamp, excluded.last_timestamp),
+        }
+    )
+    return stmt
+
+
+# merge freshly inserted rows into the hourly and daily rollups, caller commits
+async def update_rollups(db: AsyncSession, rows: List[dict]):
+    await _upsert(db, MeasurementRollupHourly, aggregate_rows(rows, hour_bucket))
+    await _upsert(db, MeasurementRollupDaily, aggregate_rows(rows, day_bucket))
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import time
+from typing import Dict
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.sensor import IoTSensor
+
+# how long the in-process sensor registry is trusted before reloading
+SENSOR_CACHE_TTL = float(os.getenv("SENSOR_CACHE_TTL", "60"))
+# minimum gap between forced reloads triggered by unknown sensor ids
+SENSOR_CACHE_MIN_REFRESH = float(os.getenv("SENSOR_CACHE_MIN_REFRESH", "5"))
+
+_sensors: Dict[str, dict] = {}
+_loaded_at = 0.0
+_lock = asyncio.Lock()
+
+
+async def _load_sensors(db: AsyncSession):
+    global _sensors, _loaded_at
+    result = await db.execute(
+        select(IoTSensor.sensor_id, IoTSensor.station_code, IoTSensor.measurement_property)
+    )
+    _sensors = {
+        row.sensor_id: {
+            "sensor_id": row.sensor_id,
+            "station_code": row.station_code,
+            "measurement_property": row.measurement_property,
+        }
+        for row in result
+    }
+    _loaded_at = time.monotonic()
+
+
+# registered sensors keyed by sensor_id, reloaded from DB at most every SENSOR_CACHE_TTL
+async def get_sensors(db: AsyncSession, refresh: bool = False) -> Dict[str, dict]:
+    age = time.monotonic() - _loaded_at
+    if age < SENSOR_CACHE_TTL and not (refresh and age >= SENSOR_CACHE_MIN_REFRESH):
+        return _sensors
+
+    async with _lock:
+        # another coroutine may have reloaded while we waited
+        age = time.monotonic() - _loaded_at
+        if age >= SENSOR_CACHE_TTL or (refresh and age >= SENSOR_CACHE_MIN_REFRESH):
+            await _load_sensors(db)
+    return _sensors
+
+
+# split sensor ids into known and unknown, reloading once if some are missing
+async def resolve_sensors(db: AsyncSession, sensor_ids) -> Dict[str, dict]:
+    sensors = await get_sensors(db)
+    if any(sensor_id not in sensors for sensor_id in sensor_ids):
+        sensors = await get_sensors(db, refresh=True)
+    return sensors
+
+
+def invalidate_sensors():
+    global _loaded_at
+    _loaded_at = 0.0
@@ -0,0 +1,35 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+# orjson is much faster and handles UUID/date/datetime natively; fall back to json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# serializer for UUID, Decimal, date and datetime
+def default_serializer(obj):
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(
+        f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+# encode a payload once into the bytes that are cached and sent to clients
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=default_serializer)
+    return json.dumps(obj, default=default_serializer, separators=(",", ":")).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
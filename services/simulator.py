@@ -0,0 +1,280 @@
+"""IoT reading simulator and ingest load generator.
+
+Reads sensors from the stations/iot_sensors tables (or synthesizes N
+stations with a temperature, humidity and wind sensor each) and emits
+readings at a fixed rate per sensor from concurrent asyncio workers,
+writing them in batches through the regular ingest path.
+
+`run_simulation` is the in-app variant started with the application: one
+worker at a time (holding a redis lease) emits a reading per registered
+sensor every SIMULATION_INTERVAL seconds into the ingest queue, while it
+is switched on through /iot/start-iot.
+
+    python -m services.simulator --synthesize 3334 --rate 1 --workers 16 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import date, datetime
+from typing import List, Optional
+from uuid import uuid4
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_redis
+from models.ids import uuid7
+from models.sensor import IoTSensor
+from models.station import Station
+from services.ingest import write_measurements
+from services.ingest_queue import IngestPipeline, IngestUnavailable
+from services.latest import update_latest
+from services.sensors import get_sensors, invalidate_sensors
+
+# value range, category and unit per measurement property
+READING_PROFILES = {
+    "temperature": (-30.0, 45.0, "Temperature", "Celsius"),
+    "humidity": (10.0, 90.0, "Humidity", "%"),
+    "wind": (1.0, 50.0, "Wind", "m/s"),
+}
+SYNTHETIC_CITY = "Simulated"
+
+logger = logging.getLogger(__name__)
+
+# interval between simulated readings of every registered sensor
+SIMULATION_INTERVAL = float(os.getenv("SIMULATION_INTERVAL", "10"))
+# on/off switch and leader lease shared by every worker
+SIMULATION_ENABLED_KEY = "iot:simulation:enabled"
+SIMULATION_LEADER_KEY = "iot:simulation:leader"
+
+RENEW_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+# one random measurement row for a sensor, None for unknown properties
+def generate_reading(sensor: dict, timestamp: Optional[datetime] = None) -> Optional[dict]:
+    profile = READING_PROFILES.get(sensor["measurement_property"].lower())
+    if profile is None:
+        return None
+
+    low, high, category, unit = profile
+    return {
+        "measurement_id": uuid7(),
+        "sensor_id": sensor["sensor_id"],
+        "station_code": sensor["station_code"],
+        "measurement_value": round(random.uniform(low, high), 1),
+        "category": category,
+        "timestamp": timestamp or datetime.utcnow(),
+        "unit": unit,
+    }
+
+
+async def is_simulation_enabled() -> bool:
+    redis_client = await get_redis()
+    return bool(await redis_client.exists(SIMULATION_ENABLED_KEY))
+
+
+# returns False if the simulation already was in the requested state
+async def set_simulation_enabled(enabled: bool) -> bool:
+    redis_client = await get_redis()
+    if enabled:
+        return bool(await redis_client.set(SIMULATION_ENABLED_KEY, "1", nx=True))
+    return bool(await redis_client.delete(SIMULATION_ENABLED_KEY))
+
+
+# take the leader lease or extend it if this worker already holds it
+async def _hold_lease(token: str) -> bool:
+    redis_client = await get_redis()
+    lease_ms = int(SIMULATION_INTERVAL * 3000)
+    if await redis_client.set(SIMULATION_LEADER_KEY, token, nx=True, px=lease_ms):
+        return True
+    return bool(await redis_client.eval(RENEW_LEASE_SCRIPT, 1, SIMULATION_LEADER_KEY, token, lease_ms))
+
+
+# emit one reading per registered sensor into the ingest queue every interval,
+# while the simulation is switched on and this worker is the leader
+async def run_simulation(pipeline: IngestPipeline):
+    token = uuid4().hex
+    while True:
+        try:
+            if await is_simulation_enabled() and await _hold_lease(token):
+                async with AsyncSessionLocal() as db:
+                    sensors = await get_sensors(db)
+                timestamp = datetime.utcnow()
+                rows = [row for row in (generate_reading(sensor, timestamp) for sensor in sensors.values()) if row]
+                await pipeline.put(rows)
+        except asyncio.CancelledError:
+            raise
+        except IngestUnavailable:
+            return
+        except Exception as e:
+            logger.warning("IoT simulation cycle failed: %s", e)
+
+        await asyncio.sleep(SIMULATION_INTERVAL)
+
+
+async def load_sensors(db: AsyncSession) -> List[dict]:
+    sensors = await get_sensors(db, refresh=True)
+    return list(sensors.values())
+
+
+# register `count` synthetic stations, `per_city` to a city, with one sensor per property
+async def synthesize_sensors(db: AsyncSession, count: int, per_city: int = 100) -> List[dict]:
+    stations = [
+        {
+            "code": f"SIM-{index:05d}",
+            "city": f"{SYNTHETIC_CITY} {index // per_city}",
+            "latitude": round(random.uniform(-60, 60), 6),
+            "longitude": round(random.uniform(-180, 180), 6),
+            "installation_date": date.today(),
+        }
+        for index in range(count)
+    ]
+    sensors = [
+        {
+            "sensor_id": f"{station['code']}-{prop[:4].upper()}",
+            "station_code": station["code"],
+            "measurement_property": prop,
+        }
+        for station in stations
+        for prop in READING_PROFILES
+    ]
+
+    # stay under the bind parameter limit
+    for start in range(0, len(stations), 5000):
+        await db.execute(pg_insert(Station).values(stations[start:start + 5000]).on_conflict_do_nothing())
+    for start in range(0, len(sensors), 10000):
+        await db.execute(pg_insert(IoTSensor).values(sensors[start:start + 10000]).on_conflict_do_nothing())
+    await db.commit()
+    invalidate_sensors()
+    return sensors
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    """Concurrent workers emitting readings at `rate` per sensor per second."""
+
+    def __init__(self, sensors: List[dict], rate: float = 1.0, workers: int = 8, batch_size: int = 1000):
+        self.sensors = sensors
+        self.rate = rate
+        self.workers = max(1, min(workers, len(sensors)))
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batch_latencies: List[float] = []
+        self.lagging_ticks = 0
+        self._running = False
+        self._started: Optional[float] = None
+        self._elapsed: Optional[float] = None
+
+    async def _write_batch(self, rows: List[dict]):
+        start = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as session:
+                await write_measurements(session, rows)
+                await session.commit()
+        except Exception as e:
+            self.rows_failed += len(rows)
+            logger.warning("load generator batch of %d rows failed: %s", len(rows), e)
+            return
+        self.batch_latencies.append(time.perf_counter() - start)
+        self.rows_written += len(rows)
+        await update_latest(rows)
+
+    async def _worker(self, shard: List[dict]):
+        interval = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while self._running:
+            timestamp = datetime.utcnow()
+            rows = [row for row in (generate_reading(sensor, timestamp) for sensor in shard) if row]
+            for start in range(0, len(rows), self.batch_size):
+                await self._write_batch(rows[start:start + self.batch_size])
+
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # writes can't keep up with the requested rate
+                self.lagging_ticks += 1
+                next_tick = time.monotonic()
+
+    async def run(self, duration: Optional[float] = None):
+        self._running = True
+        self._started = time.monotonic()
+        shards = [self.sensors[index::self.workers] for index in range(self.workers)]
+        tasks = [asyncio.create_task(self._worker(shard)) for shard in shards]
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            self.stop()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._elapsed = time.monotonic() - self._started
+
+    def stop(self):
+        self._running = False
+
+    def report(self) -> dict:
+        elapsed = self._elapsed
+        if elapsed is None:
+            elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        latencies = sorted(self.batch_latencies)
+        return {
+            "sensors": len(self.sensors),
+            "workers": self.workers,
+            "target_rows_per_sec": len(self.sensors) * self.rate,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "elapsed_sec": elapsed,
+            "rows_per_sec": self.rows_written / elapsed if elapsed else 0.0,
+            "batches": len(latencies),
+            "lagging_ticks": self.lagging_ticks,
+            "write_latency_ms": {
+                "p50": percentile(latencies, 50) * 1000,
+                "p95": percentile(latencies, 95) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            },
+        }
+
+
+async def main(args):
+    async with AsyncSessionLocal() as session:
+        if args.synthesize:
+            sensors = await synthesize_sensors(session, args.synthesize)
+        else:
+            sensors = await load_sensors(session)
+
+    if not sensors:
+        raise SystemExit("No sensors registered, use --synthesize N to create some.")
+
+    generator = LoadGenerator(sensors, rate=args.rate, workers=args.workers, batch_size=args.batch_size)
+    print(f"-- Emitting {len(sensors) * args.rate:.0f} readings/s from {len(sensors)} sensors for {args.duration}s")
+    await generator.run(args.duration)
+    print(json.dumps(generator.report(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IoT ingest load generator")
+    parser.add_argument("--synthesize", type=int, default=0, metavar="N",
+                        help="register N synthetic stations (3 sensors each) instead of using existing sensors")
+    parser.add_argument("--rate", type=float, default=1.0, help="readings per sensor per second")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent writer tasks")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per INSERT batch")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run")
+    asyncio.run(main(parser.parse_args()))
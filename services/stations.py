@@ -0,0 +1,60 @@
+import os
+import time
+from typing import Dict, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.station import Station
+
+# how long a city -> station codes mapping is trusted before reloading
+STATION_CACHE_TTL = float(os.getenv("STATION_CACHE_TTL", "300"))
+
+_station_codes: Dict[str, Tuple[float, List[str]]] = {}
+
+
+# station codes located in a city, cached in-process per lowercased city
+async def get_station_codes(db: AsyncSession, city: str) -> List[str]:
+    city_key = city.lower()
+    cached = _station_codes.get(city_key)
+    if cached and time.monotonic() - cached[0] < STATION_CACHE_TTL:
+        return cached[1]
+
+    result = await db.execute(
+        select(Station.code)
+        .where(func.lower(Station.city) == city_key)
+        .order_by(Station.code)
+    )
+    codes = list(result.scalars().all())
+    _station_codes[city_key] = (time.monotonic(), codes)
+    return codes
+
+
+# station codes for many cities, resolving every uncached city in one query
+async def get_station_codes_many(db: AsyncSession, cities: List[str]) -> Dict[str, List[str]]:
+    now = time.monotonic()
+    codes: Dict[str, List[str]] = {}
+    missing = []
+    for city_key in {city.lower() for city in cities}:
+        cached = _station_codes.get(city_key)
+        if cached and now - cached[0] < STATION_CACHE_TTL:
+            codes[city_key] = cached[1]
+        else:
+            missing.append(city_key)
+
+    if missing:
+        result = await db.execute(
+            select(func.lower(Station.city), Station.code)
+            .where(func.lower(Station.city).in_(missing))
+            .order_by(Station.code)
+        )
+        loaded: Dict[str, List[str]] = {city_key: [] for city_key in missing}
+        for city_key, code in result:
+            loaded[city_key].append(code)
+        for city_key, city_codes in loaded.items():
+            _station_codes[city_key] = (now, city_codes)
+        codes.update(loaded)
+    return codes
+
+
+def invalidate_station_codes():
+    _station_codes.clear()
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List
+from database import AsyncSessionLocal
+from services.cache import refresh, remaining_ttls
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# how many of the most requested keys are kept warm
+CACHE_WARM_TOP_K = int(os.getenv("CACHE_WARM_TOP_K", "200"))
+# refresh a key once less than this many seconds of its TTL are left (jittered down to half)
+CACHE_WARM_AHEAD = float(os.getenv("CACHE_WARM_AHEAD", "30"))
+CACHE_WARM_INTERVAL = float(os.getenv("CACHE_WARM_INTERVAL", "5"))
+CACHE_WARM_CONCURRENCY = int(os.getenv("CACHE_WARM_CONCURRENCY", "4"))
+# request counts halve every CACHE_WARM_HALF_LIFE seconds, so popularity follows traffic
+CACHE_WARM_HALF_LIFE = float(os.getenv("CACHE_WARM_HALF_LIFE", "300"))
+CACHE_WARM_MAX_TRACKED = int(os.getenv("CACHE_WARM_MAX_TRACKED", "10000"))
+
+
+# loader that opens its own session, for recomputing outside of any request
+def with_session(build: Callable[..., Awaitable[bytes]], *args) -> Callable[[], Awaitable[bytes]]:
+    async def load() -> bytes:
+        async with AsyncSessionLocal() as db:
+            return await build(db, *args)
+    return load
+
+
+class TrackedKey:
+    __slots__ = ("score", "seen_at", "ttl", "loader")
+
+    def __init__(self, ttl: int, loader: Callable[[], Awaitable[bytes]], now: float):
+        self.score = 0.0
+        self.seen_at = now
+        self.ttl = ttl
+        self.loader = loader
+
+
+class CacheWarmer:
+    """Tracks request frequency per cache key and refreshes the top-K keys
+    shortly before their redis TTL runs out."""
+
+    def __init__(self, top_k: int, ahead: float, interval: float, concurrency: int,
+                 half_life: float, max_tracked: int):
+        self.top_k = top_k
+        self.ahead = ahead
+        self.interval = interval
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._keys: Dict[str, TrackedKey] = {}
+        self.refreshes = 0
+        self.skipped = 0
+        self.failures = 0
+
+    def _score(self, entry: TrackedKey, now: float) -> float:
+        return entry.score * 0.5 ** ((now - entry.seen_at) / self.half_life)
+
+    # count a request for a cached key and remember how to rebuild it
+    def record(self, key: str, ttl: int, loader: Callable[[], Awaitable[bytes]]):
+        now = time.monotonic()
+        entry = self._keys.get(key)
+        if entry is None:
+            if len(self._keys) >= self.max_tracked:
+                self._evict(now)
+            entry = self._keys[key] = TrackedKey(ttl, loader, now)
+        entry.score = self._score(entry, now) + 1
+        entry.seen_at = now
+        entry.ttl = ttl
+        entry.loader = loader
+
+    # forget the least requested tenth, amortized over many inserts
+    def _evict(self, now: float):
+        ranked = sorted(self._keys, key=lambda key: self._score(self._keys[key], now))
+        for key in ranked[:max(1, len(ranked) // 10)]:
+            del self._keys[key]
+
+    def top(self) -> List[str]:
+        now = time.monotonic()
+        ranked = sorted(self._keys, key=lambda key: self._score(self._keys[key], now), reverse=True)
+        return ranked[:self.top_k]
+
+    async def _refresh(self, key: str, entry: TrackedKey):
+        async with self._semaphore:
+            try:
+                if await refresh(key, entry.ttl, entry.loader):
+                    self.refreshes += 1
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                # e.g. a city whose forecasts are gone, stop warming it
+                self.failures += 1
+                self._keys.pop(key, None)
+                logger.debug("cache warm of %s failed: %s", key, e)
+
+    # refresh every top key that is missing or about to expire
+    async def warm_once(self):
+        keys = self.top()
+        if not keys:
+            return
+
+        ttls = await remaining_ttls(keys)
+        due = [
+            key for key in keys
+            # -1 means no expiry, nothing to warm
+            if ttls[key] != -1 and ttls[key] < self.ahead * 1000 * random.uniform(0.5, 1.0)
+        ]
+        await asyncio.gather(*(self._refresh(key, self._keys[key]) for key in due if key in self._keys))
+
+    async def run(self):
+        while True:
+            # jittered so workers don't all scan at the same moment
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+            try:
+                await self.warm_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("cache warming failed: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "tracked_keys": len(self._keys),
+            "top_k": self.top_k,
+            "refreshes": self.refreshes,
+            "skipped": self.skipped,
+            "failures": self.failures,
+        }
+
+
+warmer = CacheWarmer(
+    CACHE_WARM_TOP_K, CACHE_WARM_AHEAD, CACHE_WARM_INTERVAL, CACHE_WARM_CONCURRENCY,
+    CACHE_WARM_HALF_LIFE, CACHE_WARM_MAX_TRACKED
+)
+registry.gauge_callback("cache_warmer", "Cache warming scheduler state", warmer.stats)
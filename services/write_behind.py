@@ -0,0 +1,266 @@
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+from uuid import UUID
+from database import env_flag
+from services.ingest import is_transient, write_isolating_bad_rows
+from services.latest import update_latest
+from services.metrics import registry
+from services.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# off by default: queued batches are then written by the ingest consumers directly
+WRITE_BEHIND_ENABLED = env_flag("WRITE_BEHIND_ENABLED", False)
+# group commit once this many rows are buffered or this much time has passed
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "5000"))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+# producers wait once this many rows are buffered, so the ingest queue behind
+# them fills up and pushes back on clients instead of memory growing unbounded
+WRITE_BEHIND_MAX_BUFFERED = int(os.getenv("WRITE_BEHIND_MAX_BUFFERED", "20000"))
+# rows that could not be committed are appended here and replayed later; every
+# worker shares the file, appends and replays hold an flock on {path}.lock
+WRITE_BEHIND_SPILL_PATH = os.getenv("WRITE_BEHIND_SPILL_PATH", "spill/measurements.ndjson")
+# rows postgres rejects (a value out of range, an unknown sensor, ...) are
+# moved here with the error instead of being retried forever
+WRITE_BEHIND_DEAD_LETTER_PATH = os.getenv("WRITE_BEHIND_DEAD_LETTER_PATH", "spill/measurements.rejected.ndjson")
+# pause before retrying postgres after a failed flush, doubled up to the max
+WRITE_BEHIND_RETRY_MIN = 0.5
+WRITE_BEHIND_RETRY_MAX = 30.0
+
+write_behind_flush_duration = registry.histogram(
+    "write_behind_flush_duration_seconds", "Time to group commit one write-behind flush")
+
+
+def _spill_row(row: dict) -> dict:
+    return {**row, "measurement_value": float(row["measurement_value"])}
+
+
+def _restore_row(row: dict) -> dict:
+    row["measurement_id"] = UUID(row["measurement_id"])
+    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return row
+
+
+class WriteBehindBuffer:
+    """Bounded in-memory measurement buffer flushed in one transaction by size
+    or time, spilling to an append-only NDJSON file while postgres is
+    unavailable and moving rows it rejects to a dead-letter file."""
+
+    def __init__(
+        self, max_rows: int, flush_ms: int, spill_path: str,
+        max_buffered: int = WRITE_BEHIND_MAX_BUFFERED, dead_letter_path: str = WRITE_BEHIND_DEAD_LETTER_PATH,
+    ):
+        self.max_rows = max_rows
+        self.flush_interval = flush_ms / 1000
+        self.spill_path = spill_path
+        self.max_buffered = max_buffered
+        self.dead_letter_path = dead_letter_path
+        # called with the number of rows once they are committed
+        self.on_written: Optional[Callable[[int], None]] = None
+        self.rows_buffered = 0
+        self.rows_written = 0
+        self.rows_spilled = 0
+        self.rows_replayed = 0
+        self.rows_rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._rows: List[dict] = []
+        self._full: Optional[asyncio.Event] = None
+        self._room: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+        self._retry_delay = WRITE_BEHIND_RETRY_MIN
+
+    async def start(self):
+        self._full = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._task = asyncio.create_task(self._run())
+
+    # stop the flusher and write (or spill) whatever is still buffered
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._retry_at = 0.0
+        await self.flush()
+
+    # buffer rows, waiting while the buffer is full until a flush makes room
+    async def add(self, rows: List[dict]):
+        while self._room is not None and len(self._rows) >= self.max_buffered:
+            self._room.clear()
+            self._full.set()
+            await self._room.wait()
+        self._rows.extend(rows)
+        self.rows_buffered += len(rows)
+        if len(self._rows) >= self.max_rows and self._full is not None:
+            self._full.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            rows, self._rows = self._rows, []
+            if self._room is not None:
+                self._room.set()
+            if time.monotonic() < self._retry_at:
+                # postgres failed recently, don't hold rows in memory meanwhile
+                if rows:
+                    await self._spill(rows)
+                return
+
+            try:
+                if os.path.exists(self.spill_path):
+                    await self._replay_spill()
+                if rows:
+                    with write_behind_flush_duration.time():
+                        written, stored = await self._write(rows)
+                    self.rows_written += written
+                    self.flushes += 1
+                    self._report_written(written)
+                    await update_latest(stored)
+            except asyncio.CancelledError:
+                self._rows = rows + self._rows
+                raise
+            except Exception as e:
+                # only transient errors get here, the rows can succeed later
+                self.failed_flushes += 1
+                self._retry_at = time.monotonic() + self._retry_delay
+                self._retry_delay = min(self._retry_delay * 2, WRITE_BEHIND_RETRY_MAX)
+                logger.warning("write-behind flush failed, spilling %d rows: %s", len(rows), e)
+                if rows:
+                    await self._spill(rows)
+                return
+            self._retry_delay = WRITE_BEHIND_RETRY_MIN
+
+    # write rows, moving the ones postgres rejects to the dead-letter file;
+    # raises only on transient errors, returns (rows written, rows committed)
+    async def _write(self, rows: List[dict], lock_held: bool = False) -> Tuple[int, List[dict]]:
+        try:
+            written, stored, rejected = await write_isolating_bad_rows(rows)
+        except Exception as e:
+            if is_transient(e):
+                raise
+            # not caused by one row and not going away, retrying would stall every later flush
+            logger.exception("write-behind write failed, moving %d rows to %s", len(rows), self.dead_letter_path)
+            rejected, written, stored = [(row, e) for row in rows], 0, []
+        if rejected:
+            logger.warning(
+                "postgres rejected %d measurements, moved to %s, e.g. %s: %s",
+                len(rejected), self.dead_letter_path, rejected[0][0]["measurement_id"], rejected[0][1],
+            )
+            await self._dead_letter(rejected, lock_held)
+        return written, stored
+
+    def _report_written(self, count: int):
+        if self.on_written is not None and count:
+            self.on_written(count)
+
+    # append rows to the spill file and fsync before they are considered safe
+    async def _spill(self, rows: List[dict]):
+        payload = b"".join(dumps(_spill_row(row)) + b"\n" for row in rows)
+        await asyncio.to_thread(self._append, self.spill_path, payload)
+        self.rows_spilled += len(rows)
+
+    # flock is per open file, so a caller already holding the spill lock must
+    # not take it a second time
+    async def _dead_letter(self, rejected: List[Tuple[dict, Exception]], lock_held: bool = False):
+        payload = b"".join(dumps({**_spill_row(row), "error": str(error)}) + b"\n" for row, error in rejected)
+        append = self._append_locked if lock_held else self._append
+        await asyncio.to_thread(append, self.dead_letter_path, payload)
+        self.rows_rejected += len(rejected)
+
+    # exclusive across processes; the lock file is never removed, so every
+    # worker always locks the same inode
+    def _open_lock(self) -> int:
+        directory = os.path.dirname(self.spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return os.open(f"{self.spill_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    # appends to both the spill and the dead-letter file hold the spill lock
+    def _append(self, path: str, payload: bytes):
+        lock = self._open_lock()
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._append_locked(path, payload)
+        finally:
+            os.close(lock)
+
+    def _append_locked(self, path: str, payload: bytes):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "ab") as target:
+            target.write(payload)
+            target.flush()
+            os.fsync(target.fileno())
+
+    # a line cut short by a crash mid-append is moved to the dead-letter file
+    def _read_spill(self) -> List[dict]:
+        rows = []
+        with open(self.spill_path, "rb") as spill:
+            for line in spill:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(_restore_row(loads(line)))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning("unreadable spilled measurement moved to %s: %s", self.dead_letter_path, e)
+                    self._append_locked(self.dead_letter_path, line.rstrip(b"\n") + b"\n")
+                    self.rows_rejected += 1
+        return rows
+
+    # replay spilled rows, skipping any already stored and moving rejected ones
+    # to the dead-letter file, then drop the file; other workers share the
+    # file, so the spill lock is held from reading to removal and their
+    # appends wait instead of landing in a file about to be deleted
+    async def _replay_spill(self):
+        lock = await asyncio.to_thread(self._open_lock)
+        try:
+            await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+            # another worker may have replayed it while we waited
+            if not os.path.exists(self.spill_path):
+                return
+            rows = await asyncio.to_thread(self._read_spill)
+            written, stored = await self._write(rows, lock_held=True)
+            os.remove(self.spill_path)
+        finally:
+            os.close(lock)
+        self.rows_replayed += written
+        self._report_written(written)
+        await update_latest(stored)
+        logger.info("replayed %d spilled measurements", written)
+
+    def status(self) -> dict:
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "buffered": len(self._rows),
+            "max_buffered": self.max_buffered,
+            "rows_buffered": self.rows_buffered,
+            "rows_written": self.rows_written,
+            "rows_spilled": self.rows_spilled,
+            "rows_replayed": self.rows_replayed,
+            "rows_rejected": self.rows_rejected,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "spill_pending": os.path.exists(self.spill_path),
+        }
+
+
+write_behind = WriteBehindBuffer(WRITE_BEHIND_MAX_ROWS, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_SPILL_PATH)
+registry.gauge_callback("write_behind", "Write-behind measurement buffer state", write_behind.status)
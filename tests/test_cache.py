@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from fastapi import Request
+from redis.exceptions import ConnectionError
+
+import services.cache as cache
+from services.compression import COMPRESSION_MIN_SIZE, encoded_etag
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.local_cache.clear()
+    cache._generations.clear()
+
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_invalidate_city_drops_local_entries_and_notifies_workers(monkeypatch):
+    commands = []
+
+    async def redis_pipeline(*pipelined):
+        commands.append(pipelined)
+
+    monkeypatch.setattr(cache, "redis_pipeline", redis_pipeline)
+    cache.local_cache.set("weather:paris:forecast", b"paris")
+    cache.local_cache.set("forecasts:paris:7", b"paris")
+    cache.local_cache.set("weather:lyon:forecast", b"lyon")
+    cache._generations["paris"] = (float("inf"), 3)
+
+    asyncio.run(cache.invalidate_city("Paris"))
+
+    assert cache.local_cache.get("weather:paris:forecast") is None
+    assert cache.local_cache.get("forecasts:paris:7") is None
+    assert cache.local_cache.get("weather:lyon:forecast") == b"lyon"
+    assert "paris" not in cache._generations
+    # generation bump and broadcast go out in one round trip
+    assert commands == [(("incr", "cache:gen:paris"), ("publish", cache.INVALIDATION_CHANNEL, "paris"))]
+
+
+def test_invalidate_city_survives_redis_outage(monkeypatch):
+    async def redis_pipeline(*pipelined):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(cache, "redis_pipeline", redis_pipeline)
+    cache.local_cache.set("weather:paris:forecast", b"paris")
+
+    asyncio.run(cache.invalidate_city("paris"))
+
+    assert cache.local_cache.get("weather:paris:forecast") is None
+
+
+def test_cached_response_answers_matching_etag_with_304():
+    payload = b'{"city":"Paris"}'
+    response = asyncio.run(cache.cached_response(payload, make_request(), max_age=10))
+    tag = response.headers["etag"]
+    assert response.body == payload
+    assert response.headers["cache-control"] == "public, max-age=10"
+
+    for header in (tag, f'"other", W/{tag}', "*"):
+        cached = asyncio.run(cache.cached_response(payload, make_request(if_none_match=header)))
+        assert cached.status_code == 304
+        assert cached.body == b""
+
+    changed = asyncio.run(cache.cached_response(b'{"city":"Lyon"}', make_request(if_none_match=tag)))
+    assert changed.status_code == 200
+
+
+def test_compressed_etag_revalidates_against_the_payload():
+    payload = b'{"values":[' + b",".join(b"1" for _ in range(COMPRESSION_MIN_SIZE)) + b"]}"
+    response = asyncio.run(cache.cached_response(payload, make_request(accept_encoding="gzip")))
+    tag = cache.etag(payload)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == encoded_etag(tag, "gzip")
+
+    cached = asyncio.run(cache.cached_response(
+        payload, make_request(accept_encoding="gzip", if_none_match=response.headers["etag"])
+    ))
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == response.headers["etag"]
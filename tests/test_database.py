@@ -0,0 +1,33 @@
+import asyncio
+
+from sqlalchemy.util import greenlet_spawn
+
+from database import InstrumentedQueuePool, pool_metrics
+
+
+class FakeConnection:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_only_checkouts_opening_an_overflow_connection_are_counted():
+    pool = InstrumentedQueuePool(FakeConnection, pool_size=1, max_overflow=2)
+    checkouts, overflow_checkouts = pool_metrics.checkouts, pool_metrics.overflow_checkouts
+
+    def scenario():
+        first = pool.connect()
+        # opens a second connection beyond pool_size, kept once returned
+        second = pool.connect()
+        second.close()
+        # reuses it while the pool is still over pool_size
+        third = pool.connect()
+        third.close()
+        first.close()
+
+    asyncio.run(greenlet_spawn(scenario))
+
+    assert pool_metrics.checkouts - checkouts == 3
+    assert pool_metrics.overflow_checkouts - overflow_checkouts == 1
@@ -0,0 +1,35 @@
+import pytest
+
+import routes.export as export
+
+
+# no stations, so a request that gets past the bound checks ends in a 404
+@pytest.fixture
+def client(monkeypatch, make_client):
+    async def station_codes(db, city):
+        return []
+
+    monkeypatch.setattr(export, "get_station_codes", station_codes)
+    return make_client(export.router)
+
+
+def test_aware_start_with_default_end(client):
+    response = client.get("/export/measurements", params={"cities": "Simulated 0", "start": "2026-10-10T00:00:00Z"})
+    # reaches the station lookup instead of failing to compare naive and aware bounds
+    assert response.status_code == 404
+
+
+def test_naive_bounds_are_utc(client):
+    response = client.get("/export/measurements", params={
+        "cities": "Simulated 0", "start": "2026-10-10T00:00:00", "end": "2026-10-09T00:00:00+02:00",
+    })
+    assert response.status_code == 400
+
+
+def test_content_disposition_escapes_city_names():
+    header = export.content_disposition('Saint "Étienne";\r\nX_measurements.csv')
+
+    assert header == (
+        'attachment; filename="Saint_tienne_X_measurements.csv"; '
+        "filename*=UTF-8''Saint%20%22%C3%89tienne%22%3B%0D%0AX_measurements.csv"
+    )
@@ -0,0 +1,51 @@
+import asyncio
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import routes.forecasts as forecasts
+from models.forecast import UserForecast
+
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    cities = []
+
+    async def invalidate_city(city):
+        cities.append(city)
+
+    monkeypatch.setattr(forecasts, "invalidate_city", invalidate_city)
+    return cities
+
+
+@pytest.fixture
+def forecast(session):
+    forecast = UserForecast(
+        forecast_id=uuid.uuid4(), forecast_date=date(2026, 10, 18), city="Paris",
+        temperature=Decimal("20.00"), humidity=Decimal("50.00"), wind=Decimal("5.00"),
+    )
+    session.rows = {UserForecast: [forecast]}
+    return forecast
+
+
+class CityUpdate:
+    """Partial update moving the forecast to another city."""
+
+    def dict(self, exclude_unset=False):
+        return {"city": "Lyon"}
+
+
+def test_moving_a_forecast_invalidates_both_cities(session, forecast, invalidated):
+    updated = asyncio.run(forecasts.update_forecast(forecast.forecast_id, CityUpdate(), session))
+
+    assert updated.city == "Lyon"
+    assert invalidated == ["Lyon", "Paris"]
+
+
+def test_updating_in_place_invalidates_the_city_once(make_client, forecast, invalidated):
+    response = make_client(forecasts.router).put(f"/forecasts/{forecast.forecast_id}", json={"temperature": 21.5})
+
+    assert response.status_code == 200
+    assert invalidated == ["Paris"]
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import routes.iot as iot
+
+
+@pytest.fixture
+def latest():
+    return []
+
+
+@pytest.fixture
+def client(monkeypatch, make_client, latest):
+    async def resolve_sensors(db, sensor_ids):
+        return {
+            sensor_id: {"station_code": sensor_id.rsplit("-", 1)[0]}
+            for sensor_id in sensor_ids
+            if sensor_id != "UNKNOWN"
+        }
+
+    # duplicate ids fail like the primary key does unless skip_existing is set
+    async def write_measurements(db, rows, skip_existing=False):
+        stored = {row["measurement_id"] for row in db.written}
+        new = [row for row in rows if row["measurement_id"] not in stored]
+        if len(new) < len(rows) and not skip_existing:
+            raise IntegrityError("INSERT INTO weather_measurements", {}, Exception("duplicate key"))
+        db.written.extend(new)
+        return len(new)
+
+    async def update_latest(rows, publish=True):
+        latest.extend(rows)
+
+    monkeypatch.setattr(iot, "INGEST_BATCH_SIZE", 2)
+    monkeypatch.setattr(iot, "resolve_sensors", resolve_sensors)
+    monkeypatch.setattr(iot, "write_measurements", write_measurements)
+    monkeypatch.setattr(iot, "update_latest", update_latest)
+    return make_client(iot.router)
+
+
+def line(sensor_id: str, value: float, timestamp: str, measurement_id: str = None) -> str:
+    return json.dumps({
+        **({"measurement_id": measurement_id} if measurement_id else {}),
+        "sensor_id": sensor_id, "measurement_value": value, "category": "Temperature",
+        "timestamp": timestamp, "unit": "Celsius",
+    })
+
+
+def post_ndjson(client, lines):
+    return client.post(
+        "/iot/measurements/bulk", content="\n".join(lines), headers={"Content-Type": "application/x-ndjson"}
+    )
+
+
+def test_ndjson_is_written_in_batches_and_committed_once(client, session, latest):
+    response = post_ndjson(client, [
+        line("ST1-TEMP", 1.0, "2026-10-17T10:00:00Z"),
+        line("ST1-TEMP", 2.0, "2026-10-17T10:01:00Z"),
+        line("UNKNOWN", 3.0, "2026-10-17T10:02:00Z"),
+        line("ST2-TEMP", 4.0, "2026-10-17T10:03:00Z"),
+    ])
+
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 3, "rejected": 1, "unknown_sensors": ["UNKNOWN"]}
+    assert session.commits == 1
+    # the live state only gets the newest reading per station
+    assert sorted((row["station_code"], row["measurement_value"]) for row in latest) == [("ST1", 2.0), ("ST2", 4.0)]
+
+
+def test_invalid_line_after_a_full_batch_stores_nothing(client, session, latest):
+    response = post_ndjson(client, [
+        line("ST1-TEMP", 1.0, "2026-10-17T10:00:00Z"),
+        line("ST1-TEMP", 2.0, "2026-10-17T10:01:00Z"),
+        line("ST1-TEMP", 3.0, "2026-10-17T10:02:00Z"),
+        '{"sensor_id": "ST1-TEMP", "measurement_value": "warm"}',
+    ])
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["body", 4]
+    # the body is validated before the first batch is written
+    assert session.written == []
+    assert session.commits == 0
+    assert latest == []
+
+
+def test_retried_body_writes_nothing_twice(client, session):
+    lines = [
+        line("ST1-TEMP", 1.0, "2026-10-17T10:00:00Z", "0192a0b0-0000-7000-8000-000000000001"),
+        line("ST1-TEMP", 2.0, "2026-10-17T10:01:00Z", "0192a0b0-0000-7000-8000-000000000002"),
+        line("ST2-TEMP", 3.0, "2026-10-17T10:02:00Z", "0192a0b0-0000-7000-8000-000000000003"),
+    ]
+    first = post_ndjson(client, lines)
+    # the client lost the response and sends the same body again
+    retry = post_ndjson(client, lines)
+
+    assert first.json()["inserted"] == 3
+    assert retry.status_code == 200
+    assert retry.json() == {"inserted": 0, "rejected": 0, "unknown_sensors": []}
+    assert len(session.written) == 3
+
+
+def test_value_outside_the_decimal_column_is_a_422(client, session):
+    response = client.post("/iot/measurements/bulk", json=[json.loads(line("ST1-TEMP", 1e8, "2026-10-17T10:00:00Z"))])
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 0, "measurement_value"]
+    assert session.written == []
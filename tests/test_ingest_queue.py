@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from sqlalchemy.exc import DataError, DBAPIError, OperationalError
+
+import services.ingest as ingest
+import services.ingest_queue as ingest_queue
+from services.ingest import is_row_error
+from services.ingest_queue import IngestPipeline
+
+
+def reading(value: float) -> dict:
+    return {
+        "measurement_id": uuid4(),
+        "sensor_id": "SIM-00001-TEMP",
+        "station_code": "SIM-00001",
+        "measurement_value": value,
+        "category": "Temperature",
+        "timestamp": datetime.now(timezone.utc),
+        "unit": "Celsius",
+    }
+
+
+def test_one_bad_row_does_not_drop_its_batch(monkeypatch, session):
+    attempts, latest = [], []
+
+    # a value the DECIMAL(10,2) column can't hold fails the whole statement
+    async def write_measurements(db, rows, skip_existing=False):
+        attempts.append(len(rows))
+        if any(row["measurement_value"] >= 1e8 for row in rows):
+            raise DataError("INSERT INTO weather_measurements", {}, Exception("numeric field overflow"))
+        db.written.extend(rows)
+        return len(rows)
+
+    async def update_latest(rows, publish=True):
+        latest.extend(rows)
+
+    monkeypatch.setattr(ingest, "AsyncSessionLocal", lambda: session)
+    monkeypatch.setattr(ingest, "write_measurements", write_measurements)
+    monkeypatch.setattr(ingest_queue, "update_latest", update_latest)
+    pipeline = IngestPipeline(100, 1, 100, 0, retries=3)
+    batch = [reading(1.0), reading(2.0), reading(1e8), reading(4.0)]
+
+    asyncio.run(pipeline._write(batch))
+
+    assert [row["measurement_value"] for row in session.written] == [1.0, 2.0, 4.0]
+    assert pipeline.rows_written == 3
+    assert pipeline.rows_failed == 1
+    assert [row["measurement_value"] for row in latest] == [1.0, 2.0, 4.0]
+    # split in halves down to the bad row, never retried as a transient error
+    assert attempts == [4, 2, 2, 1, 1]
+
+
+class AsyncpgError(Exception):
+    def __init__(self, sqlstate):
+        self.sqlstate = sqlstate
+
+
+def test_row_errors_are_told_apart_by_sqlstate():
+    # asyncpg's data exceptions arrive as plain DBAPIError
+    assert is_row_error(DBAPIError("INSERT", {}, AsyncpgError("22003")))
+    assert is_row_error(DBAPIError("INSERT", {}, AsyncpgError("23503")))
+    assert not is_row_error(DBAPIError("INSERT", {}, AsyncpgError("57P03")))
+    assert not is_row_error(OperationalError("INSERT", {}, ConnectionRefusedError()))
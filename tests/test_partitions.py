@@ -0,0 +1,76 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+import services.partitions as partitions
+from services.partitions import DEFAULT_PARTITION, PARENT_TABLE, partition_name
+
+
+class FakeResult:
+    def __init__(self, rows=(), value=None, rowcount=0):
+        self.rows = list(rows)
+        self.value = value
+        self.rowcount = rowcount
+
+    def scalars(self):
+        return iter(self.rows)
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    """Records statements; the default partition holds rows for `stray_days`."""
+
+    def __init__(self, existing, stray_days):
+        self.existing = existing
+        self.stray_days = stray_days
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append(sql)
+        if "FROM pg_inherits" in sql:
+            return FakeResult(rows=self.existing)
+        if sql.startswith("SELECT EXISTS"):
+            return FakeResult(value=params["lower"].date() in self.stray_days)
+        if sql.startswith("WITH moved"):
+            return FakeResult(rowcount=3)
+        return FakeResult()
+
+
+def run_maintenance(monkeypatch, existing, stray_days, today):
+    conn = FakeConnection(existing, stray_days)
+
+    class FakeEngine:
+        @asynccontextmanager
+        async def begin(self):
+            yield conn
+
+    monkeypatch.setattr(partitions, "engine", FakeEngine())
+    monkeypatch.setattr(partitions, "MEASUREMENT_PARTITION_PREMAKE", 2)
+    monkeypatch.setattr(partitions, "MEASUREMENT_RETENTION_DAYS", 0)
+    result = asyncio.run(partitions.maintain_partitions(today=today))
+    return conn.statements, result
+
+
+def test_creates_missing_partitions_directly_when_default_is_clear(monkeypatch):
+    statements, result = run_maintenance(monkeypatch, [partition_name(date(2026, 10, 17))], set(), date(2026, 10, 17))
+
+    assert result["created"] == [partition_name(date(2026, 10, 18)), partition_name(date(2026, 10, 19))]
+    assert not any("DETACH PARTITION" in sql for sql in statements)
+
+
+def test_moves_default_rows_into_new_partition(monkeypatch):
+    stray = date(2026, 10, 19)
+    statements, result = run_maintenance(monkeypatch, [], {stray}, date(2026, 10, 17))
+
+    detach = statements.index(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    create = next(i for i, sql in enumerate(statements) if f"TABLE IF NOT EXISTS {partition_name(stray)} " in sql)
+    move = next(i for i, sql in enumerate(statements) if sql.startswith("WITH moved"))
+    attach = statements.index(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    assert detach < create < move < attach
+    assert partition_name(stray) in result["created"]
+    # partitions without stray rows are created before the default is detached
+    clear = next(i for i, sql in enumerate(statements) if partition_name(date(2026, 10, 17)) in sql)
+    assert clear < detach
@@ -0,0 +1,121 @@
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from redis.exceptions import ConnectionError
+from sqlalchemy.dialects import postgresql
+
+import routes.weather as weather
+import services.cache as cache
+from models.forecast import UserForecast
+from models.measurement import WeatherMeasurement
+
+CATEGORIES = (("Temperature", "Celsius"), ("Humidity", "%"), ("Wind", "m/s"))
+
+
+def latest_measurements(station_code: str):
+    return [
+        WeatherMeasurement(
+            measurement_id=uuid.uuid4(), sensor_id=f"{station_code}-{category[:4].upper()}",
+            station_code=station_code, measurement_value=Decimal("12.50"), category=category,
+            timestamp=datetime.now(timezone.utc), unit=unit,
+        )
+        for category, unit in CATEGORIES
+    ]
+
+
+def tomorrow_forecast(city: str):
+    return UserForecast(
+        forecast_id=uuid.uuid4(), forecast_date=date.today() + timedelta(days=1), city=city,
+        temperature=Decimal("20.00"), humidity=Decimal("50.00"), wind=Decimal("5.00"),
+    )
+
+
+def compiled(statement):
+    return statement.compile(dialect=postgresql.dialect())
+
+
+@pytest.fixture(autouse=True)
+def without_redis(monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    async def station_codes(db, city):
+        return ["ST1", "ST2"]
+
+    async def station_codes_many(db, cities):
+        return {city.lower(): ["ST1", "ST2"] for city in cities}
+
+    # the widget reads everything from the database, as when seeding live state
+    monkeypatch.setattr(weather, "get_station_latest", unavailable)
+    monkeypatch.setattr(cache, "get_redis", unavailable)
+    monkeypatch.setattr(weather, "get_station_codes", station_codes)
+    monkeypatch.setattr(weather, "get_station_codes_many", station_codes_many)
+    cache.local_cache.clear()
+    cache._generations.clear()
+
+
+@pytest.fixture
+def client(make_client, session):
+    session.rows = {
+        WeatherMeasurement: latest_measurements("ST1") + latest_measurements("ST2"),
+        UserForecast: [tomorrow_forecast("Paris")],
+    }
+    return make_client(weather.router)
+
+
+def test_widget_reads_latest_per_station_category_and_one_forecast(client, session):
+    response = client.get("/weather/Paris")
+
+    assert response.status_code == 200
+    assert set(response.json()["current_weather"]) == {"temperature", "humidity", "wind"}
+    assert response.json()["user_forecast"]["city"] == "Paris"
+
+    measurements, forecast = (compiled(statement) for statement in session.statements)
+    # one statement per table, neither joins the other, so the rows read don't
+    # grow with the city's forecast history
+    assert "user_forecasts" not in str(measurements)
+    assert "weather_measurements" not in str(forecast) and "JOIN" not in str(forecast)
+    assert forecast.params["param_1"] == 1
+
+    # the newest reading of each (station, category) pair, however old it is
+    assert "FROM (VALUES " in str(measurements)
+    assert "JOIN LATERAL (SELECT " in str(measurements)
+    assert "WHERE weather_measurements.station_code = pairs.station_code " \
+        "AND weather_measurements.category = pairs.category " \
+        "ORDER BY weather_measurements.timestamp DESC" in str(measurements)
+    assert "weather_measurements.timestamp >=" not in str(measurements)
+    pairs = list(measurements.params.values())
+    assert pairs[:-1] == [
+        code_or_category
+        for station_code in ("ST1", "ST2")
+        for category in ("Temperature", "Humidity", "Wind")
+        for code_or_category in (station_code, category)
+    ]
+    assert pairs[-1] == 1
+
+
+def test_widget_answers_matching_etag_with_304(client):
+    response = client.get("/weather/Paris")
+    assert response.headers["cache-control"] == f"public, max-age={weather.WIDGET_MAX_AGE}"
+
+    cached = client.get("/weather/Paris", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == response.headers["etag"]
+
+
+def test_widget_batch_post_is_not_conditional_or_publicly_cacheable(client):
+    response = client.post("/weather", json={"cities": ["Paris", "paris"]})
+    assert response.status_code == 200
+    assert [widget["city"] for widget in response.json()] == ["Paris"]
+    assert "cache-control" not in response.headers
+
+    # If-None-Match on a POST never yields a 304, the ETag is only informational
+    repeated = client.post(
+        "/weather", json={"cities": ["Paris"]}, headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert repeated.status_code == 200
+    assert repeated.json() == response.json()
+    assert repeated.headers["etag"] == response.headers["etag"]
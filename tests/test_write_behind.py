@@ -0,0 +1,172 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.exc import DataError, OperationalError, ProgrammingError
+
+import services.ingest as ingest
+import services.write_behind as write_behind_module
+from services.ingest_queue import IngestPipeline
+from services.write_behind import WriteBehindBuffer
+
+
+def reading(value: float) -> dict:
+    return {
+        "measurement_id": uuid4(),
+        "sensor_id": "SIM-00001-TEMP",
+        "station_code": "SIM-00001",
+        "measurement_value": value,
+        "category": "Temperature",
+        "timestamp": datetime.now(timezone.utc),
+        "unit": "Celsius",
+    }
+
+
+@pytest.fixture
+def postgres(monkeypatch, session):
+    """Fake database behind write_isolating_bad_rows: values the DECIMAL(10,2)
+    column can't hold fail their statement, `down` fails every write."""
+    postgres = {"down": None, "latest": []}
+
+    async def write_measurements(db, rows, skip_existing=False):
+        if postgres["down"] is not None:
+            raise postgres["down"]
+        if any(row["measurement_value"] >= 1e8 for row in rows):
+            raise DataError("INSERT INTO weather_measurements", {}, Exception("numeric field overflow"))
+        db.written.extend(rows)
+        return len(rows)
+
+    async def update_latest(rows, publish=True):
+        postgres["latest"].extend(rows)
+
+    monkeypatch.setattr(ingest, "AsyncSessionLocal", lambda: session)
+    monkeypatch.setattr(ingest, "write_measurements", write_measurements)
+    monkeypatch.setattr(write_behind_module, "update_latest", update_latest)
+    return postgres
+
+
+def make_buffer(tmp_path, **options) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        100, 200, str(tmp_path / "spill.ndjson"), dead_letter_path=str(tmp_path / "rejected.ndjson"), **options
+    )
+
+
+def values(rows):
+    return [row["measurement_value"] for row in rows]
+
+
+def test_poisoned_spill_file_is_replayed_around_bad_rows(tmp_path, postgres, session):
+    buffer = make_buffer(tmp_path)
+    asyncio.run(buffer._spill([reading(1.0), reading(1e8), reading(2.0)]))
+    # a line cut short by a crash mid-append
+    with open(buffer.spill_path, "ab") as spill:
+        spill.write(b'{"measurement_id": "0192')
+
+    asyncio.run(buffer.add([reading(3.0)]))
+    asyncio.run(buffer.flush())
+
+    assert values(session.written) == [1.0, 2.0, 3.0]
+    assert buffer.rows_replayed == 2
+    assert buffer.rows_written == 1
+    assert buffer.rows_rejected == 2
+    assert buffer.failed_flushes == 0
+    assert not (tmp_path / "spill.ndjson").exists()
+    truncated, overflow = (tmp_path / "rejected.ndjson").read_bytes().splitlines()
+    assert truncated == b'{"measurement_id": "0192'
+    assert json.loads(overflow)["measurement_value"] == 1e8
+    assert "numeric field overflow" in json.loads(overflow)["error"]
+
+    # later flushes are not held up by the rejected rows
+    asyncio.run(buffer.add([reading(4.0)]))
+    asyncio.run(buffer.flush())
+    assert values(session.written) == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_only_transient_errors_spill(tmp_path, postgres, session):
+    buffer = make_buffer(tmp_path)
+    postgres["down"] = OperationalError("INSERT", {}, ConnectionRefusedError())
+    asyncio.run(buffer.add([reading(1.0)]))
+    asyncio.run(buffer.flush())
+
+    assert values(buffer._read_spill()) == [1.0]
+    assert buffer.rows_rejected == 0
+
+    # an error that won't go away is not spilled again, it would fail every replay
+    buffer._retry_at = 0.0
+    postgres["down"] = ProgrammingError("INSERT", {}, Exception("column does not exist"))
+    asyncio.run(buffer.add([reading(2.0)]))
+    asyncio.run(buffer.flush())
+
+    assert not (tmp_path / "spill.ndjson").exists()
+    assert buffer.rows_rejected == 2
+    rejected = (tmp_path / "rejected.ndjson").read_bytes().splitlines()
+    assert [json.loads(line)["measurement_value"] for line in rejected] == [1.0, 2.0]
+
+
+def test_full_buffer_pushes_back_and_rows_count_once_committed(tmp_path, postgres, session):
+    async def scenario():
+        buffer = make_buffer(tmp_path, max_buffered=2)
+        pipeline = IngestPipeline(100, 1, 100, 0, 0)
+        pipeline.attach_sink(buffer)
+        await buffer.start()
+        buffer._task.cancel()
+
+        await pipeline._write([reading(1.0), reading(2.0)])
+        # buffered is not written
+        assert pipeline.rows_written == 0
+
+        blocked = asyncio.create_task(pipeline._write([reading(3.0)]))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+
+        await buffer.flush()
+        await blocked
+        assert pipeline.rows_written == 2
+        assert values(buffer._rows) == [3.0]
+
+        await buffer.stop()
+        assert pipeline.rows_written == 3
+
+    asyncio.run(scenario())
+
+
+def test_append_during_replay_is_not_lost(tmp_path, monkeypatch):
+    buffer = WriteBehindBuffer(100, 200, str(tmp_path / "spill.ndjson"))
+    asyncio.run(buffer._spill([reading(1.0)]))
+    replayed = []
+
+    async def scenario():
+        writing, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_write(rows):
+            replayed.extend(rows)
+            writing.set()
+            await release.wait()
+            return len(rows), rows, []
+
+        async def no_update(rows, publish=True):
+            pass
+
+        monkeypatch.setattr(write_behind_module, "write_isolating_bad_rows", slow_write)
+        monkeypatch.setattr(write_behind_module, "update_latest", no_update)
+
+        replay = asyncio.create_task(buffer._replay_spill())
+        await writing.wait()
+        # another worker spilling while the file is being replayed
+        other = WriteBehindBuffer(100, 200, buffer.spill_path)
+        payload = write_behind_module.dumps(write_behind_module._spill_row(reading(2.0))) + b"\n"
+        appender = threading.Thread(target=other._append, args=(other.spill_path, payload))
+        appender.start()
+        await asyncio.sleep(0.1)
+        assert appender.is_alive()
+        release.set()
+        await replay
+        await asyncio.to_thread(appender.join)
+
+    asyncio.run(scenario())
+
+    assert [row["measurement_value"] for row in replayed] == [1.0]
+    assert [row["measurement_value"] for row in buffer._read_spill()] == [2.0]